@@ -1,22 +1,56 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from pydantic import BaseModel
+from typing import List, Optional
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import sys
 from pathlib import Path
 
-import pandas as pd
-from services.data import StockDataService
-from models.analysis import TechnicalAnalysis
-from services.signals import SignalService
-from services.analysis_service import MarketAnalysisService
+from services.data import StockDataService, PERIOD_DAYS
+from models.panel import PanelAnalysis
+from services.executor import BlockingExecutor, ExecutorBusyError, ExecutorTimeoutError
+from services.reports import generate_sample_chart_data, generate_sample_ai_analysis
+from services.snapshots import SnapshotService, SnapshotScheduler
+from services.responses import FastJSONResponse, CacheValidator, CACHE_MAX_AGE, CHART_FORMATS, chart_response
+from services.downsampling import DEFAULT_CHART_POINTS, MAX_CHART_POINTS
+from services.compression import CompressionMiddleware
+from services.live import LiveBroadcaster
+from services.metrics import metrics, MetricsMiddleware
+from services.profiling import ProfilingMiddleware
 
 # appディレクトリをパスに追加
 sys.path.append(str(Path(__file__).parent))
 
 app = FastAPI(title="日経平均分析アプリ")
 
+# トークン付きのリクエストのプロファイリング（NIKKEI_PROFILING_TOKEN を設定した場合のみ有効）
+app.add_middleware(ProfilingMiddleware)
+
+# レスポンスの圧縮（brotli / gzip）
+app.add_middleware(CompressionMiddleware)
+
+# ステージごとの所要時間の記録と Server-Timing ヘッダー（圧縮も含めて計測するため最も外側に置く）
+app.add_middleware(MetricsMiddleware)
+
+# データ取得・分析処理を実行するスレッドプール（イベントループをブロックしないため）
+executor = BlockingExecutor()
+metrics.gauge("nikkei_executor_pending", lambda: executor.pending)
+
+# 日次の分析レポートのスナップショット（大引け後に事前計算し、リクエスト時は参照のみ）
+snapshots = SnapshotService()
+snapshot_scheduler = SnapshotScheduler(snapshots)
+
+# 場中の最新値を全クライアントへ配信（計算は購読者数によらず1回）
+live = LiveBroadcaster(executor)
+
+# 混雑で拒否したリクエストに再試行までの目安として返す秒数（Retry-After）
+BUSY_RETRY_AFTER = int(os.environ.get("NIKKEI_BUSY_RETRY_AFTER", "5"))
+
+# 一括分析で1回に受け付けるティッカー数の上限
+MAX_BATCH_TICKERS = int(os.environ.get("NIKKEI_MAX_BATCH_TICKERS", "300"))
+
 # 現在のファイルが存在するディレクトリを取得
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
@@ -24,65 +58,64 @@ STATIC_DIR = os.path.join(BASE_DIR, "static")
 # 静的ファイルのマウント
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+@app.on_event("startup")
+async def start_snapshot_scheduler():
+    if os.environ.get("NIKKEI_SNAPSHOT_SCHEDULER", "1") != "0":
+        snapshot_scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    snapshot_scheduler.stop()
+    live.stop()
+    executor.shutdown()
+
+def report_validator(name, period, *extra, **options):
+    """レポートを計算せずに条件付きGET用の検証子を作る（取引日が切り替わるまで有効）"""
+    parts, last_modified, expires_in = snapshots.validator(name, period, **options)
+    return CacheValidator(parts + extra, last_modified, min(CACHE_MAX_AGE, expires_in))
+
 @app.get("/")
 async def read_root():
     return {"message": "日経平均分析APIへようこそ"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """処理ステージの所要時間・キャッシュのヒット率・フォールバック数などを Prometheus のテキスト形式で返す"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/nikkei/analysis")
-async def get_nikkei_analysis(period: str = "1y"):
-    """日経平均の基本的な分析結果を取得するエンドポイント"""
+async def get_nikkei_analysis(
+    request: Request,
+    period: str = "1y",
+    chart_format: str = Query("records", alias="format"),
+    max_points: Optional[int] = None
+):
+    """日経平均の基本的な分析結果を取得するエンドポイント
+    
+    format で chart_data の形式を指定する（records: 日付ごとのオブジェクト, columnar: 列ごとの配列, binary: バイナリ）。
+    chart_data は期間全体を max_points 点以内（既定 DEFAULT_CHART_POINTS）に間引いて返す。
+    ETag が一致する条件付きGETには、計算せずに 304 を返す。
+    """
+    if chart_format not in CHART_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不明な形式です: {chart_format}")
+    if max_points is not None and not 3 <= max_points <= MAX_CHART_POINTS:
+        raise HTTPException(status_code=400, detail=f"max_points は 3〜{MAX_CHART_POINTS} で指定してください")
+    if max_points == DEFAULT_CHART_POINTS:
+        max_points = None  # 既定値は事前計算済みのスナップショットを使う
+    
     try:
-        print(f"リクエストされた期間: {period}")  # デバッグ用
-
-        # データ取得
-        data_service = StockDataService()
-        data = data_service.get_nikkei_data(period=period)
-        
-        print(f"取得データ行数: {len(data)}, 期間: {data.index[0]} から {data.index[-1]}")  # デバッグ用
-        
-        if data.empty:
-            return JSONResponse(
-                status_code=200,
-                content={"message": "サンプルデータを使用しています", "sample": True}
-            )
-        
-        # 技術的分析の実施
-        analyzer = TechnicalAnalysis()
-        rsi = analyzer.calculate_rsi(data)
-        macd_data = analyzer.calculate_macd(data)
-        
-        # 最新の結果を返す
-        latest_data = {}
-        latest_data['price'] = data['Close'].iloc[-1]
-        latest_data['rsi'] = rsi.iloc[-1]
-        latest_data['macd'] = macd_data['MACD'].iloc[-1]
-        latest_data['signal'] = macd_data['Signal'].iloc[-1]
-        latest_data['date'] = data.index[-1].strftime('%Y-%m-%d')
-        
-        # チャートデータの準備
-        chart_data = data[['Close']].tail(200).copy()
-        chart_data['RSI'] = rsi
-        chart_data['MACD'] = macd_data['MACD']
-        chart_data['Signal'] = macd_data['Signal']
-        chart_data = chart_data.reset_index()
-        
-        # 日付フォーマット変換
-        chart_data['date'] = chart_data['Date'].dt.strftime('%Y-%m-%d') if 'Date' in chart_data.columns else chart_data.index.strftime('%Y-%m-%d')
-        chart_data = chart_data.rename(columns={'Close': 'Price'})
-        
-        # 必要な列だけを取得
-        needed_columns = ['date', 'Price', 'RSI', 'MACD', 'Signal']
-        available_columns = [col for col in needed_columns if col in chart_data.columns]
-        chart_data = chart_data[available_columns]
+        validator = report_validator("nikkei_analysis", period, chart_format, max_points=max_points)
+        if validator.is_fresh(request):
+            return validator.not_modified()
         
-        return {
-            "latest": latest_data,
-            "chart_data": chart_data.to_dict(orient='records'),
-            "period": period
-        }
+        payload = await executor.run(snapshots.get, "nikkei_analysis", period, max_points=max_points)
+        return validator.apply(chart_response(payload, chart_format), payload)
     
+    except (ExecutorBusyError, ExecutorTimeoutError):
+        raise  # 混雑・タイムアウトはサンプルデータにせず 503 / 504 で返す
     except Exception as e:
         import traceback
+        metrics.inc("nikkei_fallback_total", kind="error_sample", endpoint="nikkei_analysis")
         error_details = traceback.format_exc()
         print(f"エラー詳細: {error_details}")
         
@@ -98,64 +131,39 @@ async def get_nikkei_analysis(period: str = "1y"):
                 "macd": 0,
                 "signal": 0
             },
-            "chart_data": _generate_sample_chart_data()
+            "chart_data": generate_sample_chart_data()
         }
 
+
+@app.get("/api/nikkei/stream")
+async def stream_nikkei():
+    """最新値（価格・RSI・MACD・シグナル）の変化を Server-Sent Events で配信するエンドポイント
+    
+    接続直後に snapshot イベントで全項目を、以降は取引時間中に変化した項目だけを update イベントで送る。
+    """
+    return StreamingResponse(
+        live.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/nikkei/market-analysis")
-async def get_market_analysis(period: str = "1y"):
+async def get_market_analysis(request: Request, period: str = "1y"):
     """市場分析レポートを取得するエンドポイント"""
     try:
-        print(f"市場分析APIがリクエストされました: 期間={period}")
-        
-        # データ取得
-        data_service = StockDataService()
-        data = data_service.get_nikkei_data(period=period)
-        
-        print(f"データ取得完了: {len(data)}行")
-        
-        if data.empty:
-            print("空のデータフレーム - サンプルデータを返します")
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "message": "サンプルデータを使用しています", 
-                    "sample": True,
-                    "analysis": {
-                        "date": datetime.now().strftime('%Y-%m-%d'),
-                        "price": 30000,
-                        "summary": {
-                            "signal": "中立",
-                            "confidence": "低",
-                            "short_prediction": "データなし"
-                        }
-                    }
-                }
-            )
+        validator = report_validator("market_analysis", period)
+        if validator.is_fresh(request):
+            return validator.not_modified()
         
-        # 技術的分析の実施
-        analyzer = TechnicalAnalysis()
-        rsi = analyzer.calculate_rsi(data)
-        macd_data = analyzer.calculate_macd(data)
-        trend_data = analyzer.calculate_trend(data)
-        volatility_data = analyzer.analyze_volatility(data)
-        
-        print("分析計算完了")
-        
-        # 市場分析レポート生成
-        signal_service = SignalService()
-        analysis = signal_service.generate_market_analysis(
-            data, rsi, macd_data, trend_data, volatility_data
-        )
-        
-        print("分析レポート生成完了")
-        
-        return {
-            "analysis": analysis,
-            "sample": False
-        }
+        payload = await executor.run(snapshots.get, "market_analysis", period)
+        return validator.apply(FastJSONResponse(payload), payload)
     
+    except (ExecutorBusyError, ExecutorTimeoutError):
+        raise  # 混雑・タイムアウトはサンプルデータにせず 503 / 504 で返す
     except Exception as e:
         import traceback
+        metrics.inc("nikkei_fallback_total", kind="error_sample", endpoint="market_analysis")
         error_details = traceback.format_exc()
         print(f"詳細なエラー情報: {error_details}")
         
@@ -175,66 +183,24 @@ async def get_market_analysis(period: str = "1y"):
             }
         }
 
-def _generate_sample_chart_data():
-    """サンプルチャートデータを生成"""
-    import random
-    
-    data = []
-    base_price = 30000
-    base_date = datetime.now() - timedelta(days=30)
-    
-    for i in range(30):
-        date = (base_date + timedelta(days=i)).strftime('%Y-%m-%d')
-        price = base_price + random.uniform(-500, 500)
-        base_price = price
-        
-        data.append({
-            "date": date,
-            "Price": price,
-            "RSI": random.uniform(30, 70),
-            "MACD": random.uniform(-200, 200),
-            "Signal": random.uniform(-100, 100),
-            "Strong_Buy": random.random() > 0.8
-        })
-    
-    return data
+
 
 @app.get("/api/nikkei/ai-analysis")
-async def get_ai_analysis(period: str = "1y"):
+async def get_ai_analysis(request: Request, period: str = "1y"):
     """AIによる高度な市場分析を取得するエンドポイント"""
     try:
-        print(f"AI分析がリクエストされました: 期間={period}")
-        
-        # データ取得
-        data_service = StockDataService()
-        data = data_service.get_nikkei_data(period=period)
-        
-        print(f"AI分析: データ取得完了 ({len(data)}行)")
-        
-        if data.empty or len(data) < 50:
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "message": "分析に十分なデータがありません。サンプルデータを使用します。",
-                    "sample": True,
-                    "analysis": _generate_sample_ai_analysis()
-                }
-            )
+        validator = report_validator("ai_analysis", period)
+        if validator.is_fresh(request):
+            return validator.not_modified()
         
-        # 市場分析サービスを使用して包括的な分析を実行
-        analysis_service = MarketAnalysisService()
-        analysis_result = analysis_service.generate_comprehensive_analysis(data)
-        
-        print("AI分析: 分析完了")
-        
-        return {
-            "analysis": analysis_result,
-            "sample": False,
-            "period": period
-        }
+        payload = await executor.run(snapshots.get, "ai_analysis", period)
+        return validator.apply(FastJSONResponse(payload), payload)
     
+    except (ExecutorBusyError, ExecutorTimeoutError):
+        raise  # 混雑・タイムアウトはサンプルデータにせず 503 / 504 で返す
     except Exception as e:
         import traceback
+        metrics.inc("nikkei_fallback_total", kind="error_sample", endpoint="ai_analysis")
         error_details = traceback.format_exc()
         print(f"AI分析エラー: {e}")
         print(f"詳細: {error_details}")
@@ -245,56 +211,93 @@ async def get_ai_analysis(period: str = "1y"):
                 "error": str(e),
                 "message": "分析中にエラーが発生しました。サンプルデータを使用します。",
                 "sample": True,
-                "analysis": _generate_sample_ai_analysis()
+                "analysis": generate_sample_ai_analysis()
             }
         )
 
-def _generate_sample_ai_analysis():
-    """サンプルAI分析結果を生成"""
-    return {
-        "date": datetime.now().strftime('%Y-%m-%d'),
-        "price": 32500,
-        "indicators": {
-            "rsi": 52.5,
-            "macd": 15.3,
-            "macd_signal": 10.8,
-            "bollinger": {
-                "upper": 33000,
-                "middle": 32200,
-                "lower": 31400
-            },
-            "stochastic": {
-                "k": 65.2,
-                "d": 60.1
-            },
-            "adx": 22.5,
-            "volatility": 1.8
-        },
-        "market_condition": {
-            "market_phase": "強気相場（ブル・マーケット）",
-            "trend_strength": "中程度",
-            "volatility_state": "普通",
-            "market_sentiment": "中立"
-        },
-        "predictions": {
-            "short_term": {
-                "direction": "上昇",
-                "prediction": 1.2,
-                "confidence": 0.7
-            },
-            "medium_term": {
-                "direction": "横ばい",
-                "prediction": 0.3,
-                "confidence": 0.6
-            }
-        },
-        "recommendation": {
-            "action": "様子見",
-            "confidence": "中",
-            "explanation": "市場は強気相場の中で推移していますが、短期的な上昇予測の信頼性が限られています。様子見が推奨されます。"
+
+class BatchAnalysisRequest(BaseModel):
+    tickers: List[str]
+    period: str = "1y"
+
+@app.post("/api/analysis/batch")
+async def get_batch_analysis(request: BatchAnalysisRequest):
+    """複数ティッカーの分析結果をまとめて取得するエンドポイント"""
+    tickers = [ticker.strip() for ticker in request.tickers if ticker.strip()]
+    if not tickers:
+        raise HTTPException(status_code=400, detail="ティッカーを1つ以上指定してください")
+    if len(tickers) > MAX_BATCH_TICKERS:
+        raise HTTPException(status_code=400, detail=f"ティッカーは最大{MAX_BATCH_TICKERS}件まで指定できます")
+    if request.period != "max" and request.period not in PERIOD_DAYS:
+        raise HTTPException(status_code=400, detail=f"不明な期間です: {request.period}")
+    
+    try:
+        results = await executor.run(_build_batch_analysis, tickers, request.period)
+        return FastJSONResponse(results)
+    
+    except (ExecutorBusyError, ExecutorTimeoutError):
+        raise  # 混雑・タイムアウトはサンプルデータにせず 503 / 504 で返す
+    except Exception as e:
+        import traceback
+        error_details = traceback.format_exc()
+        print(f"一括分析エラー: {error_details}")
+        
+        return {
+            "error": str(e),
+            "message": "一括分析中にエラーが発生しました",
+            "period": request.period,
+            "results": {},
+            "missing": tickers
         }
+
+def _build_batch_analysis(tickers, period):
+    """複数ティッカーの分析結果を計算（スレッドプール上で実行）"""
+    print(f"一括分析がリクエストされました: {len(tickers)}ティッカー, 期間={period}")
+    
+    # データ取得（ストアと一括ダウンロードから 日付×ティッカー の行列を作成）
+    data_service = StockDataService()
+    panel, missing = data_service.get_panel_data(tickers, period=period)
+    
+    if not panel:
+        return {
+            "message": "いずれのティッカーもデータを取得できませんでした",
+            "period": period,
+            "results": {},
+            "missing": missing
+        }
+    
+    # 全ティッカーの指標を一括で計算
+    results = PanelAnalysis().analyze(panel)
+    missing = missing + [ticker for ticker in panel['Close'].columns if ticker not in results]
+    
+    print(f"一括分析完了: {len(results)}ティッカー")
+    
+    return {
+        "period": period,
+        "results": results,
+        "missing": missing
     }
 
+
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(request, exc):
+    """スレッドプールの待ち行列が上限に達している場合は 503 で再試行を促す"""
+    metrics.inc("nikkei_rejected_total", reason="busy")
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(exc), "message": "サーバーが混雑しています"},
+        headers={"Retry-After": str(BUSY_RETRY_AFTER)}
+    )
+
+@app.exception_handler(ExecutorTimeoutError)
+async def executor_timeout_handler(request, exc):
+    """処理が制限時間内に完了しなかった場合は 504 を返す"""
+    metrics.inc("nikkei_rejected_total", reason="timeout")
+    return JSONResponse(
+        status_code=504,
+        content={"error": str(exc), "message": "処理がタイムアウトしました"}
+    )
+
 @app.exception_handler(Exception)
 async def generic_exception_handler(request, exc):
     """すべての例外をキャッチしてJSONレスポンスを返す"""
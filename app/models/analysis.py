@@ -3,32 +3,39 @@ import numpy as np
 from datetime import datetime
 from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import StandardScaler
+from models.features import get_features, get_sma, rsi as calc_rsi, macd as calc_macd
+from models.registry import model_registry
+from models.walkforward import WalkForwardEvaluator
+from services.metrics import metrics
 import warnings
 warnings.filterwarnings('ignore')
 
+# ウォークフォワード検証の精度を信頼度として使うのに必要な予測数
+MIN_WALK_FORWARD_EVALUATIONS = 50
+
+# 長期のサポート/レジスタンスを計算する期間（営業日数, 約1年・約5年）
+KEY_LEVEL_LOOKBACKS = (250, 1250)
+
 class TechnicalAnalysis:
     """オリジナルの技術分析クラス"""
     
     @staticmethod
+    @metrics.timed("indicators", name="rsi")
     def calculate_rsi(data, window=14):
         """RSI (相対力指数) の計算"""
-        delta = data['Close'].diff()
-        gain = delta.where(delta > 0, 0).rolling(window=window).mean()
-        loss = -delta.where(delta < 0, 0).rolling(window=window).mean()
-        
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        return rsi
+        if window == 14:
+            return get_features(data)['rsi_14']
+        return calc_rsi(data['Close'], window)
     
     @staticmethod
+    @metrics.timed("indicators", name="macd")
     def calculate_macd(data, fast_period=12, slow_period=26, signal_period=9):
         """MACD (移動平均収束拡散法) の計算"""
-        ema_fast = data['Close'].ewm(span=fast_period, adjust=False).mean()
-        ema_slow = data['Close'].ewm(span=slow_period, adjust=False).mean()
-        
-        macd = ema_fast - ema_slow
-        signal = macd.ewm(span=signal_period, adjust=False).mean()
-        histogram = macd - signal
+        if (fast_period, slow_period, signal_period) == (12, 26, 9):
+            features = get_features(data)
+            macd, signal, histogram = features['macd'], features['macd_signal'], features['macd_hist']
+        else:
+            macd, signal, histogram = calc_macd(data['Close'], fast_period, slow_period, signal_period)
         
         return pd.DataFrame({
             'MACD': macd,
@@ -37,14 +44,15 @@ class TechnicalAnalysis:
         })
     
     @staticmethod
+    @metrics.timed("indicators", name="trend")
     def calculate_trend(data, short_period=20, medium_period=50, long_period=200):
         """トレンド分析 (短期/中期/長期移動平均線に基づく)"""
         df = pd.DataFrame()
         
         # 移動平均線の計算
-        df['MA_Short'] = data['Close'].rolling(window=short_period).mean()
-        df['MA_Medium'] = data['Close'].rolling(window=medium_period).mean()
-        df['MA_Long'] = data['Close'].rolling(window=long_period).mean()
+        df['MA_Short'] = get_sma(data, short_period)
+        df['MA_Medium'] = get_sma(data, medium_period)
+        df['MA_Long'] = get_sma(data, long_period)
         
         # 現在の価格
         latest_price = data['Close'].iloc[-1]
@@ -86,13 +94,16 @@ class TechnicalAnalysis:
         }
     
     @staticmethod
+    @metrics.timed("indicators", name="volatility")
     def analyze_volatility(data, window=20):
         """ボラティリティ分析"""
         # 日次リターンの計算
-        returns = data['Close'].pct_change()
+        features = get_features(data)
+        returns = features['returns']
         
         # ボラティリティ（標準偏差）
-        volatility = returns.rolling(window=window).std() * np.sqrt(window)
+        rolling_std = features['volatility_20'] if window == 20 else returns.rolling(window=window).std()
+        volatility = rolling_std * np.sqrt(window)
         
         # 現在のボラティリティ
         current_volatility = volatility.iloc[-1] * 100  # パーセント表示
@@ -118,67 +129,43 @@ class AdvancedAnalysis:
     """AIを活用した高度な市場分析クラス"""
     
     @staticmethod
+    @metrics.timed("indicators", name="all")
     def calculate_all_indicators(data):
         """複数の技術的指標を一括計算"""
         indicators = {}
+        features = get_features(data)
+        latest = features.iloc[-1]
         
         # 基本データ
         indicators['price'] = data['Close'].iloc[-1]
         indicators['volume'] = data['Volume'].iloc[-1] if 'Volume' in data else None
         
         # トレンド指標
-        indicators['sma_20'] = data['Close'].rolling(window=20).mean().iloc[-1]
-        indicators['sma_50'] = data['Close'].rolling(window=50).mean().iloc[-1]
-        indicators['sma_200'] = data['Close'].rolling(window=200).mean().iloc[-1]
+        indicators['sma_20'] = latest['sma_20']
+        indicators['sma_50'] = latest['sma_50']
+        indicators['sma_200'] = latest['sma_200']
         
         # 移動平均収束拡散指標（MACD）
-        ema_12 = data['Close'].ewm(span=12, adjust=False).mean()
-        ema_26 = data['Close'].ewm(span=26, adjust=False).mean()
-        indicators['macd'] = ema_12.iloc[-1] - ema_26.iloc[-1]
-        indicators['macd_signal'] = (ema_12 - ema_26).ewm(span=9, adjust=False).mean().iloc[-1]
+        indicators['macd'] = latest['ema_12'] - latest['ema_26']
+        indicators['macd_signal'] = latest['macd_signal']
         
         # RSI（相対力指数）
-        delta = data['Close'].diff()
-        gain = delta.where(delta > 0, 0).rolling(window=14).mean()
-        loss = -delta.where(delta < 0, 0).rolling(window=14).mean()
-        rs = gain / loss
-        indicators['rsi'] = 100 - (100 / (1 + rs.iloc[-1]))
+        indicators['rsi'] = latest['rsi_14']
         
         # ボリンジャーバンド
-        sma_20 = data['Close'].rolling(window=20).mean()
-        std_20 = data['Close'].rolling(window=20).std()
-        indicators['bb_upper'] = (sma_20 + (std_20 * 2)).iloc[-1]
-        indicators['bb_middle'] = sma_20.iloc[-1]
-        indicators['bb_lower'] = (sma_20 - (std_20 * 2)).iloc[-1]
+        indicators['bb_upper'] = latest['bb_upper']
+        indicators['bb_middle'] = latest['sma_20']
+        indicators['bb_lower'] = latest['bb_lower']
         
         # ストキャスティクス
-        high_14 = data['High'].rolling(window=14).max() if 'High' in data else data['Close'].rolling(window=14).max()
-        low_14 = data['Low'].rolling(window=14).min() if 'Low' in data else data['Close'].rolling(window=14).min()
-        k = 100 * ((data['Close'] - low_14) / (high_14 - low_14))
-        indicators['stoch_k'] = k.iloc[-1]
-        indicators['stoch_d'] = k.rolling(window=3).mean().iloc[-1]
+        indicators['stoch_k'] = latest['stoch_k']
+        indicators['stoch_d'] = latest['stoch_d']
         
         # 平均方向性指数（ADX）- トレンドの強さを測定
-        if 'High' in data and 'Low' in data:
-            high_diff = data['High'].diff()
-            low_diff = -data['Low'].diff()
-            tr1 = data['High'] - data['Low']
-            tr2 = abs(data['High'] - data['Close'].shift(1))
-            tr3 = abs(data['Low'] - data['Close'].shift(1))
-            tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-            atr_14 = tr.rolling(window=14).mean()
-            
-            # +DI と -DI
-            plus_dm = ((high_diff > low_diff) & (high_diff > 0)) * high_diff
-            minus_dm = ((low_diff > high_diff) & (low_diff > 0)) * low_diff
-            plus_di_14 = 100 * (plus_dm.rolling(window=14).mean() / atr_14)
-            minus_di_14 = 100 * (minus_dm.rolling(window=14).mean() / atr_14)
-            
-            # ADX
-            dx = 100 * abs(plus_di_14 - minus_di_14) / (plus_di_14 + minus_di_14)
-            indicators['adx'] = dx.rolling(window=14).mean().iloc[-1]
-            indicators['plus_di'] = plus_di_14.iloc[-1]
-            indicators['minus_di'] = minus_di_14.iloc[-1]
+        if 'adx' in features:
+            indicators['adx'] = latest['adx']
+            indicators['plus_di'] = latest['plus_di']
+            indicators['minus_di'] = latest['minus_di']
         
         # フィボナッチリトレースメント
         recent_high = data['Close'].tail(90).max()
@@ -190,132 +177,273 @@ class AdvancedAnalysis:
         indicators['fib_618'] = recent_high - (diff * 0.618)
         
         # ボラティリティ指標
-        indicators['volatility'] = data['Close'].pct_change().rolling(window=20).std().iloc[-1] * 100
+        indicators['volatility'] = latest['volatility_20'] * 100
         
         return indicators
     
     @staticmethod
     def predict_trend(data, days_ahead=14):
         """AIを使用した短期予測"""
+        return AdvancedAnalysis.predict_trends(data, [days_ahead])[days_ahead]
+    
+    @staticmethod
+    def predict_trends(data, horizons=(7, 30)):
+        """複数の予測日数をまとめて予測
+        
+        特徴量（説明変数）の行列は1回だけ作成し、学習行が同じ予測日数は
+        多出力の線形回帰1回でまとめて学習する。予測日数ごとに predict_trend と同じ形式の辞書を返す。
+        """
+        insufficient = {"prediction": "データ不足", "confidence": 0.0, "direction": "不明"}
         try:
             # 最低限のデータポイント数を確保
             if len(data) < 60:
-                return {"prediction": "データ不足", "confidence": 0.0, "direction": "不明"}
-                
-            # 特徴量エンジニアリング
-            df = pd.DataFrame()
-            
-            # 価格データ
-            df['price'] = data['Close']
-            
-            # 技術的指標を特徴量として追加
-            df['sma_5'] = data['Close'].rolling(window=5).mean()
-            df['sma_10'] = data['Close'].rolling(window=10).mean()
-            df['sma_20'] = data['Close'].rolling(window=20).mean()
-            
-            # RSI
-            delta = data['Close'].diff()
-            gain = delta.where(delta > 0, 0).rolling(window=14).mean()
-            loss = -delta.where(delta < 0, 0).rolling(window=14).mean()
-            rs = gain / loss
-            df['rsi'] = 100 - (100 / (1 + rs))
-            
-            # MACD
-            ema_12 = data['Close'].ewm(span=12, adjust=False).mean()
-            ema_26 = data['Close'].ewm(span=26, adjust=False).mean()
-            df['macd'] = ema_12 - ema_26
+                return {h: dict(insufficient) for h in horizons}
             
-            # ボラティリティ
-            df['volatility'] = data['Close'].pct_change().rolling(window=20).std()
-            
-            # ラグ特徴量（過去の価格変動）
-            for i in range(1, 6):
-                df[f'price_lag_{i}'] = df['price'].shift(i)
-                df[f'return_lag_{i}'] = df['price'].pct_change(i)
-            
-            # 移動平均乖離率
-            df['ma_ratio_5_20'] = df['sma_5'] / df['sma_20']
-            
-            # 欠損値の除去
-            df = df.dropna()
+            df = AdvancedAnalysis._build_design_matrix(data)
             
             if len(df) < 30:
-                return {"prediction": "データ不足", "confidence": 0.0, "direction": "不明"}
-            
-            # 目的変数（N日後の価格変化率）
-            df['target'] = df['price'].shift(-days_ahead) / df['price'] - 1
+                return {h: dict(insufficient) for h in horizons}
             
             # 学習データとテストデータの分割
             train_size = int(len(df) * 0.8)
-            train_data = df.iloc[:train_size].copy()
             
-            # 欠損値の除去
-            train_data = train_data.dropna()
+            # 目的変数（N日後の価格変化率）。末尾N行は目的変数が欠損するため学習行数が変わる
+            targets = pd.DataFrame(
+                {h: df['price'].shift(-h) / df['price'] - 1 for h in horizons},
+                index=df.index
+            )
+            groups = {}
+            for h in horizons:
+                train_rows = int(targets[h].iloc[:train_size].notna().sum())
+                groups.setdefault(train_rows, []).append(h)
             
-            if len(train_data) < 20:
-                return {"prediction": "データ不足", "confidence": 0.0, "direction": "不明"}
-            
-            # 特徴量とターゲットを分離
-            X_train = train_data.drop(['target', 'price'], axis=1)
-            y_train = train_data['target']
-            
-            # データ標準化
-            scaler = StandardScaler()
-            X_train_scaled = scaler.fit_transform(X_train)
-            
-            # モデルのトレーニング
-            model = LinearRegression()
-            model.fit(X_train_scaled, y_train)
-            
-            # 最新データを使って予測
-            latest_data = df.iloc[-1:].copy()
-            if 'target' in latest_data:
-                latest_data = latest_data.drop('target', axis=1)
+            # 最新データ（全予測日数で共通）
+            latest_data = df.iloc[-1:]
             latest_features = latest_data.drop('price', axis=1)
-            latest_scaled = scaler.transform(latest_features)
-            
-            # 予測
-            prediction = model.predict(latest_scaled)[0]
+            current_price = latest_data['price'].values[0]
             
-            # 予測の方向性と信頼性を計算
-            direction = "上昇" if prediction > 0 else "下降" if prediction < 0 else "横ばい"
-            abs_prediction = abs(prediction)
-            confidence = 0.7  # デフォルト値
+            # 過去の予測精度（ウォークフォワード検証）を信頼度に使う。失敗した場合は従来の目安にする
+            try:
+                evaluation = AdvancedAnalysis.evaluate_predictions(data, horizons, df)
+            except Exception as e:
+                print(f"ウォークフォワード検証エラー: {e}")
+                evaluation = {}
             
-            # 予測値の絶対値が大きいほど信頼性が高いと仮定
-            if abs_prediction > 0.05:
-                confidence = 0.9
-            elif abs_prediction > 0.02:
-                confidence = 0.8
-            elif abs_prediction > 0.01:
-                confidence = 0.7
-            else:
-                confidence = 0.6
+            results = {}
+            for train_rows, group in groups.items():
+                if train_rows < 20:
+                    for h in group:
+                        results[h] = dict(insufficient)
+                    continue
                 
-            # 現在の価格と予測価格
-            current_price = latest_data['price'].values[0]
-            predicted_price = current_price * (1 + prediction)
+                train_data = df.iloc[:train_rows]
+                
+                # 特徴量とターゲットを分離
+                X_train = train_data.drop('price', axis=1)
+                y_train = targets[group].iloc[:train_rows]
+                
+                @metrics.timed("model", op="fit")
+                def fit_model():
+                    # データ標準化
+                    scaler = StandardScaler()
+                    X_train_scaled = scaler.fit_transform(X_train)
+                    
+                    # モデルのトレーニング（予測日数ごとの多出力回帰）
+                    model = LinearRegression()
+                    model.fit(X_train_scaled, y_train)
+                    return scaler, model
+                
+                # 同じ学習データで学習済みのモデルがあれば再利用（新しい学習行がある場合のみ再学習）
+                scaler, model = model_registry.get_or_fit(
+                    AdvancedAnalysis._model_key(data, train_data, tuple(group)),
+                    fit_model
+                )
+                
+                # 予測
+                with metrics.timer("model", op="predict"):
+                    predictions = model.predict(scaler.transform(latest_features))[0]
+                for h, prediction in zip(group, predictions):
+                    results[h] = AdvancedAnalysis._prediction_result(
+                        prediction, current_price, h, evaluation.get(h)
+                    )
             
-            return {
-                "direction": direction,
-                "prediction": prediction * 100,  # パーセント表示に変換
-                "confidence": confidence,
-                "current_price": current_price,
-                "predicted_price": predicted_price,
-                "days_ahead": days_ahead
-            }
+            return {h: results[h] for h in horizons}
             
         except Exception as e:
             print(f"予測エラー: {e}")
-            return {"prediction": "計算エラー", "confidence": 0.0, "direction": "不明"}
+            return {h: {"prediction": "計算エラー", "confidence": 0.0, "direction": "不明"} for h in horizons}
+    
+    @staticmethod
+    def evaluate_predictions(data, horizons=(7, 30), df=None):
+        """predict_trends のモデルをウォークフォワード検証し、予測日数ごとの予測精度を返す
+        
+        結果はデータが変わるまでモデルレジストリに保持される。
+        """
+        if df is None:
+            df = AdvancedAnalysis._build_design_matrix(data)
+        if len(df) == 0:
+            return {h: None for h in horizons}
+        
+        key = ("walk_forward",) + AdvancedAnalysis._model_key(data, df, tuple(horizons))
+        return model_registry.get_or_fit(
+            key, metrics.timed("model", op="walk_forward")(lambda: WalkForwardEvaluator(horizons).evaluate(df))
+        )
+    
+    @staticmethod
+    @metrics.timed("model", op="design_matrix")
+    def _build_design_matrix(data):
+        """予測モデル用の特徴量行列を作成（price 列と説明変数、欠損行は除去）"""
+        # 特徴量エンジニアリング（共有の特徴量フレームから必要な列を取り出す）
+        features = get_features(data)
+        df = pd.DataFrame()
+        
+        # 価格データ
+        df['price'] = data['Close']
+        
+        # 技術的指標を特徴量として追加
+        df['sma_5'] = features['sma_5']
+        df['sma_10'] = features['sma_10']
+        df['sma_20'] = features['sma_20']
+        df['rsi'] = features['rsi_14']
+        df['macd'] = features['macd']
+        df['volatility'] = features['volatility_20']
+        
+        # ラグ特徴量（過去の価格変動）
+        for i in range(1, 6):
+            df[f'price_lag_{i}'] = df['price'].shift(i)
+            df[f'return_lag_{i}'] = df['price'].pct_change(i)
+        
+        # 移動平均乖離率
+        df['ma_ratio_5_20'] = df['sma_5'] / df['sma_20']
+        
+        # 欠損値の除去
+        return df.dropna()
     
     @staticmethod
-    def analyze_market_condition(data, indicators):
-        """総合的な市場状況分析"""
+    def _prediction_result(prediction, current_price, days_ahead, evaluation=None):
+        """予測値（変化率）から予測結果の辞書を作成
+        
+        ウォークフォワード検証の結果が十分にあれば、その方向の的中率を信頼度とする。
+        """
+        # 予測の方向性と信頼性を計算
+        direction = "上昇" if prediction > 0 else "下降" if prediction < 0 else "横ばい"
+        abs_prediction = abs(prediction)
+        confidence = 0.7  # デフォルト値
+        confidence_source = "heuristic"
+        
+        if evaluation is not None and evaluation['evaluations'] >= MIN_WALK_FORWARD_EVALUATIONS:
+            confidence = evaluation['accuracy'] / 100
+            confidence_source = "walk_forward"
+        # 検証結果がない場合は、予測値の絶対値が大きいほど信頼性が高いと仮定
+        elif abs_prediction > 0.05:
+            confidence = 0.9
+        elif abs_prediction > 0.02:
+            confidence = 0.8
+        elif abs_prediction > 0.01:
+            confidence = 0.7
+        else:
+            confidence = 0.6
+        
+        # 現在の価格と予測価格
+        predicted_price = current_price * (1 + prediction)
+        
+        return {
+            "direction": direction,
+            "prediction": prediction * 100,  # パーセント表示に変換
+            "confidence": confidence,
+            "current_price": current_price,
+            "predicted_price": predicted_price,
+            "days_ahead": days_ahead,
+            "confidence_source": confidence_source,
+            "walk_forward": evaluation
+        }
+    
+    @staticmethod
+    def _model_key(data, train_data, horizons):
+        """学習データを特定するモデルレジストリのキー
+        
+        ティッカーが不明なデータ（サンプルデータなど）でも取り違えないよう、
+        学習期間に加えて学習価格の合計をフィンガープリントとして含める。
+        """
+        return (
+            data.attrs.get('ticker'),
+            horizons,
+            train_data.index[0],
+            train_data.index[-1],
+            len(train_data),
+            float(train_data['price'].sum())
+        )
+    
+    @staticmethod
+    def find_key_levels(prices, current_price, tolerance=0.01, top_n=5, min_count=3):
+        """価格クラスタリングでサポート/レジスタンスを特定
+        
+        昇順に並べた価格を1回走査し、クラスタ平均から tolerance 以内の価格を同じクラスタとする。
+        昇順では新しい価格が既存のクラスタ平均を下回ることがないため、クラスタは連続区間になる。
+        累積和でクラスタ平均を求め、区切り位置を NumPy でまとめて探索する。
+        """
+        sorted_prices = np.sort(np.asarray(prices, dtype=float))
+        sorted_prices = sorted_prices[~np.isnan(sorted_prices)]
+        n = len(sorted_prices)
+        cumsum = np.concatenate([[0.0], np.cumsum(sorted_prices)])
+        
+        # クラスタの区間 [start, end) を求める
+        clusters = []
+        start = 0
+        while start < n:
+            end = None
+            chunk_start = start + 1
+            chunk_size = 256
+            while chunk_start < n:
+                j = np.arange(chunk_start, min(n, chunk_start + chunk_size))
+                centers = (cumsum[j] - cumsum[start]) / (j - start)
+                outside = np.abs(centers - sorted_prices[j]) / centers >= tolerance
+                if outside.any():
+                    end = int(j[np.argmax(outside)])
+                    break
+                chunk_start += chunk_size
+                chunk_size *= 2
+            if end is None:
+                end = n
+            clusters.append((start, end))
+            start = end
+        
+        # 重要度（出現回数）でソートし、上位のクラスタをサポート/レジスタンスとして抽出
+        clusters.sort(key=lambda c: c[1] - c[0], reverse=True)
+        key_levels = []
+        for start, end in clusters[:top_n]:
+            count = end - start
+            if count >= min_count:  # 少なくとも min_count 回出現
+                center = sum(sorted_prices[start:end].tolist()) / count
+                level_type = "サポート" if center < current_price else "レジスタンス"
+                key_levels.append({
+                    'price': center,
+                    'type': level_type,
+                    'strength': count
+                })
+        return key_levels
+    
+    @staticmethod
+    def key_levels_by_lookback(data, lookbacks=(60,) + KEY_LEVEL_LOOKBACKS):
+        """複数の期間（営業日数）でサポート/レジスタンスを計算"""
+        current_price = data['Close'].iloc[-1]
+        return {
+            lookback: AdvancedAnalysis.find_key_levels(data['Close'].tail(lookback), current_price)
+            for lookback in lookbacks
+        }
+    
+    @staticmethod
+    @metrics.timed("indicators", name="market_condition")
+    def analyze_market_condition(data, indicators, lookback=60):
+        """総合的な市場状況分析（lookback: サポート/レジスタンスの計算に使う営業日数）
+        
+        データが足りる場合は KEY_LEVEL_LOOKBACKS の期間のサポート/レジスタンスも key_levels_by_lookback に含める。
+        """
         # 市場フェーズの識別
         current_price = data['Close'].iloc[-1]
-        sma_50 = data['Close'].rolling(window=50).mean().iloc[-1]
-        sma_200 = data['Close'].rolling(window=200).mean().iloc[-1]
+        features = get_features(data)
+        sma_50 = features['sma_50'].iloc[-1]
+        sma_200 = features['sma_200'].iloc[-1]
         
         # 強気/弱気市場の判断
         if current_price > sma_200 and sma_50 > sma_200:
@@ -340,42 +468,10 @@ class AdvancedAnalysis:
             else:
                 trend_strength = "トレンドなし（レンジ相場）"
         
-        # サポートとレジスタンスの計算
-        recent_data = data['Close'].tail(60)
-        sorted_prices = sorted(recent_data)
-        price_clusters = []
-        
-        # 価格クラスタリングでサポート/レジスタンスを特定
-        for price in sorted_prices:
-            found_cluster = False
-            for cluster in price_clusters:
-                if abs(cluster['center'] - price) / cluster['center'] < 0.01:  # 1%以内の価格を同じクラスタと見なす
-                    cluster['count'] += 1
-                    cluster['prices'].append(price)
-                    cluster['center'] = sum(cluster['prices']) / len(cluster['prices'])
-                    found_cluster = True
-                    break
-            
-            if not found_cluster:
-                price_clusters.append({
-                    'center': price,
-                    'count': 1,
-                    'prices': [price]
-                })
-        
-        # 重要度でソート
-        price_clusters.sort(key=lambda x: x['count'], reverse=True)
-        
-        # 上位のクラスタをサポート/レジスタンスとして抽出
-        key_levels = []
-        for cluster in price_clusters[:5]:  # 上位5つのクラスタ
-            if cluster['count'] >= 3:  # 少なくとも3回出現
-                level_type = "サポート" if cluster['center'] < current_price else "レジスタンス"
-                key_levels.append({
-                    'price': cluster['center'],
-                    'type': level_type,
-                    'strength': cluster['count']
-                })
+        # サポートとレジスタンスの計算（データより長い期間は lookback と同じ結果になるため除く）
+        lookbacks = [lookback] + [n for n in KEY_LEVEL_LOOKBACKS if lookback < n <= len(data)]
+        key_levels_by_lookback = AdvancedAnalysis.key_levels_by_lookback(data, lookbacks)
+        key_levels = key_levels_by_lookback[lookback]
         
         # ボラティリティの状態評価
         volatility = indicators['volatility']
@@ -406,6 +502,7 @@ class AdvancedAnalysis:
             'market_phase': market_phase,
             'trend_strength': trend_strength,
             'key_levels': key_levels,
+            'key_levels_by_lookback': key_levels_by_lookback,
             'volatility_state': volatility_state,
             'market_sentiment': overbought
         } 
\ No newline at end of file
@@ -0,0 +1,183 @@
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from models.shared import SharedFrameStore, frame_digest
+from services.metrics import metrics
+from services.profiling import is_profiling
+
+# build_features の計算内容を変えた場合に上げる（共有済みの特徴量フレームを無効にする）
+FEATURES_VERSION = 1
+
+
+def sma(series, window):
+    """単純移動平均"""
+    return series.rolling(window=window).mean()
+
+
+def ema(series, span):
+    """指数移動平均"""
+    return series.ewm(span=span, adjust=False).mean()
+
+
+def rsi(close, window=14):
+    """RSI (相対力指数)"""
+    delta = close.diff()
+    gain = delta.where(delta > 0, 0).rolling(window=window).mean()
+    loss = -delta.where(delta < 0, 0).rolling(window=window).mean()
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+
+def macd(close, fast_period=12, slow_period=26, signal_period=9):
+    """MACD・シグナル・ヒストグラム"""
+    macd_line = ema(close, fast_period) - ema(close, slow_period)
+    signal = ema(macd_line, signal_period)
+    return macd_line, signal, macd_line - signal
+
+
+@metrics.timed("indicators", name="features")
+def build_features(data):
+    """1つのデータセットに対して全分析で使う指標列をまとめて計算
+
+    各アナライザーが個別に計算していた移動平均・EMA・RSI・ボラティリティなどを
+    1回だけ計算し、data と同じインデックスを持つデータフレームとして返す。
+    """
+    close = data['Close']
+    features = pd.DataFrame(index=data.index)
+    features['close'] = close
+
+    # 移動平均
+    for window in (5, 10, 20, 50, 200):
+        features[f'sma_{window}'] = sma(close, window)
+
+    # RSI
+    features['rsi_14'] = rsi(close, 14)
+
+    # MACD
+    features['ema_12'] = ema(close, 12)
+    features['ema_26'] = ema(close, 26)
+    features['macd'] = features['ema_12'] - features['ema_26']
+    features['macd_signal'] = ema(features['macd'], 9)
+    features['macd_hist'] = features['macd'] - features['macd_signal']
+
+    # ボリンジャーバンド
+    features['std_20'] = close.rolling(window=20).std()
+    features['bb_upper'] = features['sma_20'] + (features['std_20'] * 2)
+    features['bb_lower'] = features['sma_20'] - (features['std_20'] * 2)
+
+    # リターンとボラティリティ
+    features['returns'] = close.pct_change()
+    features['volatility_20'] = features['returns'].rolling(window=20).std()
+
+    # ストキャスティクス
+    high_14 = data['High'].rolling(window=14).max() if 'High' in data else close.rolling(window=14).max()
+    low_14 = data['Low'].rolling(window=14).min() if 'Low' in data else close.rolling(window=14).min()
+    features['stoch_k'] = 100 * ((close - low_14) / (high_14 - low_14))
+    features['stoch_d'] = features['stoch_k'].rolling(window=3).mean()
+
+    # 平均方向性指数（ADX）
+    if 'High' in data and 'Low' in data:
+        high_diff = data['High'].diff()
+        low_diff = -data['Low'].diff()
+        tr1 = data['High'] - data['Low']
+        tr2 = abs(data['High'] - close.shift(1))
+        tr3 = abs(data['Low'] - close.shift(1))
+        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+        atr_14 = tr.rolling(window=14).mean()
+
+        plus_dm = ((high_diff > low_diff) & (high_diff > 0)) * high_diff
+        minus_dm = ((low_diff > high_diff) & (low_diff > 0)) * low_diff
+        features['plus_di'] = 100 * (plus_dm.rolling(window=14).mean() / atr_14)
+        features['minus_di'] = 100 * (minus_dm.rolling(window=14).mean() / atr_14)
+        dx = 100 * abs(features['plus_di'] - features['minus_di']) / (features['plus_di'] + features['minus_di'])
+        features['adx'] = dx.rolling(window=14).mean()
+
+    return features
+
+
+class _FeatureCache:
+    """データフレームの同一性（id）をキーにした特徴量のメモ化
+
+    元のデータフレームが破棄されると対応するエントリも削除される。
+    行数と最終日が変わっていた場合（データが変更された場合）は再計算する。
+    shared が指定された場合、計算結果をデータの内容をキーにして共有メモリに公開し、
+    同じデータに対しては他のワーカーが公開済みのフレームをコピーせずに参照する。
+    """
+
+    def __init__(self, shared=None):
+        self._lock = threading.Lock()
+        self._entries = {}  # id(data) -> (weakref, 行数, 最終日, 特徴量)
+        self.shared = shared
+
+    def get(self, data):
+        if is_profiling():
+            return build_features(data)  # プロファイリング中は計算コストを測るため再利用しない
+
+        key = id(data)
+        signature = (len(data), data.index[-1] if len(data) else None)
+
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            ref, rows, last, features = entry
+            if ref() is data and (rows, last) == signature:
+                metrics.inc("nikkei_cache_requests_total", cache="features", result="hit")
+                return features
+
+        metrics.inc("nikkei_cache_requests_total", cache="features", result="miss")
+
+        features = self._load_or_build(data)
+        with self._lock:
+            self._entries[key] = (weakref.ref(data, lambda _, key=key: self._discard(key)), *signature, features)
+        return features
+
+    def _load_or_build(self, data):
+        """共有メモリに公開済みの特徴量を参照し、なければ計算して公開する"""
+        # サンプルデータは共有しない
+        if self.shared is None or len(data) == 0 or data.attrs.get('sample', False):
+            return build_features(data)
+
+        key = frame_digest(data.select_dtypes(include=np.number))
+        features = self.shared.load(key)
+        metrics.inc("nikkei_cache_requests_total", cache="shared_features", result="miss" if features is None else "hit")
+        if features is not None:
+            return features
+
+        features = build_features(data)
+        try:
+            # 公開後はメモリマップ側を使い、このワーカーのコピーは破棄する
+            return self.shared.save(key, features)
+        except OSError as e:
+            print(f"特徴量の共有エラー: {e}")
+            return features
+
+    def _discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_feature_cache = _FeatureCache(
+    SharedFrameStore("features", version=FEATURES_VERSION)
+    if os.environ.get("NIKKEI_SHARED_FEATURES", "1") != "0" else None
+)
+
+
+def get_sma(data, window):
+    """移動平均を取得（特徴量フレームにある期間はそれを再利用）"""
+    column = f'sma_{window}'
+    features = get_features(data)
+    if column in features:
+        return features[column]
+    return sma(data['Close'], window)
+
+
+def get_features(data):
+    """データセットの特徴量フレームを取得（同じデータフレームに対しては計算結果を再利用）
+
+    返されるフレームは共有されるため、変更しないこと。
+    """
+    return _feature_cache.get(data)
@@ -0,0 +1,223 @@
+import numpy as np
+
+# 行方向のスライディングウィンドウを作る際に一度に処理する行数（メモリ使用量の上限）
+WINDOW_CHUNK_ROWS = 256
+
+
+def _as_matrix(values):
+    """1次元・2次元の入力を float64 の (日付, ティッカー) 行列に揃える"""
+    matrix = np.asarray(values, dtype="float64")
+    return matrix.reshape(-1, 1) if matrix.ndim == 1 else matrix
+
+
+def _shift(matrix, periods=1):
+    """行方向に periods 行ずらす（shift と同じく空いた行は NaN）"""
+    result = np.full_like(matrix, np.nan)
+    if periods < len(matrix):
+        result[periods:] = matrix[:len(matrix) - periods]
+    return result
+
+
+def _divide(numerator, denominator):
+    """pandas と同じく0除算を inf / NaN として扱う割り算"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return numerator / denominator
+
+
+def ffill(values):
+    """欠損値を列ごとに直前の値で埋める（先頭の欠損は残る）"""
+    matrix = _as_matrix(values)
+    rows = np.where(~np.isnan(matrix), np.arange(len(matrix))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+
+def diff(values):
+    """1行前との差分"""
+    matrix = _as_matrix(values)
+    return matrix - _shift(matrix)
+
+
+def pct_change(values):
+    """変化率（pct_change と同じく欠損値は直前の値で埋めてから計算）"""
+    padded = ffill(values)
+    return _divide(padded, _shift(padded)) - 1
+
+
+def _window_counts(mask, window):
+    """各行で終わる長さ window のウィンドウ内で mask が真の件数（先頭の不完全なウィンドウは -1）"""
+    # 整数の累積和より float64 の方が速い（件数は 2**53 未満なので正確）
+    counts = np.cumsum(mask, axis=0, dtype="float64")
+    result = np.full(mask.shape, -1.0)
+    if window <= len(mask):
+        result[window - 1] = counts[window - 1]
+        result[window:] = counts[window:] - counts[:-window]
+    return result
+
+
+def _constant_windows(matrix, window):
+    """ウィンドウ内の値がすべて同じ（欠損なし）かどうか"""
+    same = np.zeros(matrix.shape, dtype=bool)
+    same[1:] = matrix[1:] == matrix[:-1]
+    # 先頭の値を除く window - 1 個が直前の値と等しければ一定値
+    return _window_counts(same, window - 1) == window - 1 if window > 1 else ~np.isnan(matrix)
+
+
+def rolling_mean(values, window):
+    """rolling(window).mean() の2次元版（ウィンドウ内に欠損があれば NaN）
+
+    列ごとの最初の値を引いてから累積和を取ることで、長い系列でも桁落ちを抑える。
+    一定値のウィンドウは値そのものを、符号の揃ったウィンドウは同じ符号を返す（pandas と同じ）ため、
+    RSI や ADX の 0 / 0 の判定が丸め誤差で変わることはない。
+    """
+    matrix = _as_matrix(values)
+    result = np.full_like(matrix, np.nan)
+    if window > len(matrix):
+        return result
+
+    valid = ~np.isnan(matrix)
+    columns = np.arange(matrix.shape[1])
+    reference = matrix[valid.argmax(axis=0), columns]
+    reference = np.where(np.isnan(reference), 0.0, reference)
+    centered = np.where(valid, matrix - reference, 0.0)
+
+    sums = np.cumsum(centered, axis=0)
+    window_sums = sums[window - 1:].copy()
+    window_sums[1:] -= sums[:-window]
+    means = window_sums / window + reference
+
+    rows = slice(window - 1, None)
+    complete = _window_counts(valid, window)[rows] == window
+    negatives = _window_counts(np.signbit(matrix) & valid, window)[rows]
+    means = np.where(_constant_windows(matrix, window)[rows], matrix[rows], means)
+    means = np.where((negatives == 0) & (means < 0), 0.0, means)
+    means = np.where((negatives == window) & (means > 0), 0.0, means)
+    result[rows] = np.where(complete, means, np.nan)
+    return result
+
+
+def rolling_std(values, window, ddof=1):
+    """rolling(window).std() の2次元版
+
+    分散は行のチャンクごとにウィンドウを展開し、平均を引いてから二乗和を取る（2パス法）。
+    """
+    matrix = _as_matrix(values)
+    result = np.full_like(matrix, np.nan)
+    if window > len(matrix) or window <= ddof:
+        return result
+
+    windows = np.lib.stride_tricks.sliding_window_view(matrix, window, axis=0)
+    for start in range(0, len(windows), WINDOW_CHUNK_ROWS):
+        chunk = windows[start:start + WINDOW_CHUNK_ROWS]
+        mean = chunk.mean(axis=-1, keepdims=True)
+        variance = ((chunk - mean) ** 2).sum(axis=-1) / (window - ddof)
+        result[window - 1 + start:window - 1 + start + len(chunk)] = np.sqrt(variance)
+    # 一定値のウィンドウは丸め誤差を残さず 0 にする（pandas と同じ）
+    return np.where(_constant_windows(matrix, window), 0.0, result)
+
+
+def _rolling_extreme(values, window, op):
+    """ウィンドウ幅を2倍ずつ広げて移動最大値/最小値を計算（log(window) 回の配列演算）
+
+    NaN は伝播するため、ウィンドウ内に欠損があれば結果は NaN になる（rolling と同じ）。
+    """
+    result = _as_matrix(values).copy()
+    span = 1
+    while span * 2 <= window:
+        result = op(result, _shift(result, span))
+        span *= 2
+    if span < window:
+        result = op(result, _shift(result, window - span))
+    return result
+
+
+def rolling_max(values, window):
+    """rolling(window).max() の2次元版"""
+    return _rolling_extreme(values, window, np.maximum)
+
+
+def rolling_min(values, window):
+    """rolling(window).min() の2次元版"""
+    return _rolling_extreme(values, window, np.minimum)
+
+
+def ema(values, span):
+    """ewm(span=span, adjust=False).mean() の2次元版
+
+    漸化式のため日付方向は1行ずつ進めるが、各行の更新は全ティッカーに対する1回の配列演算で行う。
+    欠損値の扱いも pandas（ignore_na=False）と同じ。
+    """
+    matrix = _as_matrix(values)
+    alpha = 1.0 / (1.0 + (span - 1) / 2.0)
+    old_wt_factor = 1.0 - alpha
+
+    result = np.empty_like(matrix)
+    if len(matrix) == 0:
+        return result
+    weighted = matrix[0].copy()
+    old_wt = np.ones(matrix.shape[1])
+    result[0] = weighted
+
+    for i in range(1, len(matrix)):
+        x = matrix[i]
+        is_observation = ~np.isnan(x)
+        has_value = ~np.isnan(weighted)
+
+        old_wt = np.where(has_value, old_wt * old_wt_factor, old_wt)
+        # 一定値の系列での数値誤差を避ける（pandas と同じ）
+        update = has_value & is_observation & (weighted != x)
+        weighted = np.where(update, (old_wt * weighted + alpha * x) / (old_wt + alpha), weighted)
+        old_wt = np.where(has_value & is_observation, 1.0, old_wt)
+        weighted = np.where(~has_value & is_observation, x, weighted)
+        result[i] = weighted
+    return result
+
+
+def rsi(close, window=14):
+    """RSI (相対力指数)"""
+    delta = diff(close)
+    gain = rolling_mean(np.where(delta > 0, delta, 0.0), window)
+    loss = rolling_mean(-np.where(delta < 0, delta, 0.0), window)
+    return 100 - (100 / (1 + _divide(gain, loss)))
+
+
+def macd(close, fast_period=12, slow_period=26, signal_period=9):
+    """MACD・シグナル・ヒストグラム"""
+    macd_line = ema(close, fast_period) - ema(close, slow_period)
+    signal = ema(macd_line, signal_period)
+    return macd_line, signal, macd_line - signal
+
+
+def bollinger(close, window=20, num_std=2):
+    """ボリンジャーバンド（中心線・上限・下限）"""
+    middle = rolling_mean(close, window)
+    std = rolling_std(close, window)
+    return middle, middle + (std * num_std), middle - (std * num_std)
+
+
+def stochastic(close, high=None, low=None, k_window=14, d_window=3):
+    """ストキャスティクス（%K, %D）。高値・安値がない場合は終値で代用"""
+    close = _as_matrix(close)
+    high_k = rolling_max(close if high is None else high, k_window)
+    low_k = rolling_min(close if low is None else low, k_window)
+    k = 100 * _divide(close - low_k, high_k - low_k)
+    return k, rolling_mean(k, d_window)
+
+
+def adx(high, low, close, window=14):
+    """+DI・-DI・ADX（平均方向性指数）"""
+    high, low, close = _as_matrix(high), _as_matrix(low), _as_matrix(close)
+    high_diff = diff(high)
+    low_diff = -diff(low)
+
+    # 3種類の値幅のうち欠損でない最大値
+    prev_close = _shift(close)
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+    atr = rolling_mean(tr, window)
+
+    plus_dm = ((high_diff > low_diff) & (high_diff > 0)) * high_diff
+    minus_dm = ((low_diff > high_diff) & (low_diff > 0)) * low_diff
+    plus_di = 100 * _divide(rolling_mean(plus_dm, window), atr)
+    minus_di = 100 * _divide(rolling_mean(minus_dm, window), atr)
+    dx = _divide(100 * np.abs(plus_di - minus_di), plus_di + minus_di)
+    return plus_di, minus_di, rolling_mean(dx, window)
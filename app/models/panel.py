@@ -0,0 +1,151 @@
+import numpy as np
+
+from models import kernels
+
+
+def build_panel_features(panel):
+    """「日付×ティッカー」の価格行列から全ティッカーの指標を一度に計算
+
+    features.build_features と同じ指標を models.kernels の2次元カーネルで計算するため、
+    ティッカーごとのループはなく、各指標は行列全体に対する配列演算で求まる。
+    戻り値は {指標名: (日付, ティッカー) の ndarray}。
+    """
+    close = panel['Close'].to_numpy(dtype='float64')
+    high = panel['High'].to_numpy(dtype='float64') if 'High' in panel else None
+    low = panel['Low'].to_numpy(dtype='float64') if 'Low' in panel else None
+    features = {'close': close}
+
+    # 移動平均
+    for window in (20, 50, 200):
+        features[f'sma_{window}'] = kernels.rolling_mean(close, window)
+
+    # RSI
+    features['rsi_14'] = kernels.rsi(close, 14)
+
+    # MACD
+    features['macd'], features['macd_signal'], features['macd_hist'] = kernels.macd(close)
+
+    # ボリンジャーバンド
+    _, features['bb_upper'], features['bb_lower'] = kernels.bollinger(close, 20)
+
+    # リターンとボラティリティ
+    features['returns'] = kernels.pct_change(close)
+    features['volatility_20'] = kernels.rolling_std(features['returns'], 20)
+
+    # ストキャスティクス
+    features['stoch_k'], features['stoch_d'] = kernels.stochastic(close, high, low)
+
+    # 平均方向性指数（ADX）
+    if high is not None and low is not None:
+        features['plus_di'], features['minus_di'], features['adx'] = kernels.adx(high, low, close)
+
+    return features
+
+
+class PanelAnalysis:
+    """複数ティッカーの指標をまとめて計算し、ティッカーごとの最新値を返す"""
+
+    def __init__(self, rsi_oversold=30, rsi_overbought=70):
+        self.rsi_oversold = rsi_oversold
+        self.rsi_overbought = rsi_overbought
+
+    def analyze(self, panel):
+        """ティッカーをキーにした分析結果の辞書を返す"""
+        close = panel['Close']
+        features = build_panel_features(panel)
+
+        # ティッカーごとに最後に値が存在する行（上場廃止・取得漏れで最終日が揃わない場合に対応）
+        values = features['close']
+        valid = ~np.isnan(values)
+        has_data = valid.any(axis=0)
+        last_rows = len(values) - 1 - np.argmax(valid[::-1], axis=0)
+
+        # 最新値と前日値を (指標, ティッカー) の行列として一括で取り出す
+        columns = np.arange(values.shape[1])
+        latest = {}
+        previous = {}
+        for name, matrix in features.items():
+            latest[name] = matrix[last_rows, columns]
+            previous[name] = matrix[np.maximum(last_rows - 1, 0), columns]
+
+        results = {}
+        for i, ticker in enumerate(close.columns):
+            if not has_data[i]:
+                continue
+            row = {name: _to_float(latest[name][i]) for name in latest}
+            prev = {name: _to_float(previous[name][i]) for name in previous}
+            results[ticker] = self._ticker_result(close.index[last_rows[i]], row, prev)
+        return results
+
+    def _ticker_result(self, date, row, prev):
+        price = row['close']
+        change = row['returns'] * 100 if row['returns'] is not None else None
+
+        # RSI判定
+        rsi_value = row['rsi_14']
+        if rsi_value is None:
+            rsi_signal = "データ不足"
+        elif rsi_value <= self.rsi_oversold:
+            rsi_signal = "買い (売られすぎ)"
+        elif rsi_value >= self.rsi_overbought:
+            rsi_signal = "売り (買われすぎ)"
+        else:
+            rsi_signal = "中立"
+
+        # MACD判定
+        macd_value, signal_value = row['macd'], row['macd_signal']
+        prev_macd, prev_signal = prev['macd'], prev['macd_signal']
+        if macd_value is None or signal_value is None:
+            macd_signal = "データ不足"
+        elif prev_macd is not None and prev_signal is not None and macd_value > signal_value and prev_macd <= prev_signal:
+            macd_signal = "買い (MACD上抜け)"
+        elif prev_macd is not None and prev_signal is not None and macd_value < signal_value and prev_macd >= prev_signal:
+            macd_signal = "売り (MACD下抜け)"
+        elif macd_value > signal_value:
+            macd_signal = "弱い買い (MACD > シグナル)"
+        elif macd_value < signal_value:
+            macd_signal = "弱い売り (MACD < シグナル)"
+        else:
+            macd_signal = "中立"
+
+        # トレンド判定（移動平均線との位置関係）
+        trends = {}
+        for name, window in (('short', 20), ('medium', 50), ('long', 200)):
+            average = row[f'sma_{window}']
+            if average is None:
+                trends[name] = "データ不足"
+            else:
+                trends[name] = "上昇" if price > average else "下降"
+
+        return {
+            "date": date.strftime('%Y-%m-%d'),
+            "price": price,
+            "change": change,
+            "indicators": {
+                "rsi": rsi_value,
+                "macd": macd_value,
+                "macd_signal": signal_value,
+                "bollinger": {
+                    "upper": row['bb_upper'],
+                    "middle": row['sma_20'],
+                    "lower": row['bb_lower']
+                },
+                "stochastic": {
+                    "k": row['stoch_k'],
+                    "d": row['stoch_d']
+                },
+                "adx": row.get('adx'),
+                "volatility": row['volatility_20'] * 100 if row['volatility_20'] is not None else None
+            },
+            "trends": trends,
+            "signals": {
+                "rsi": rsi_signal,
+                "macd": macd_signal
+            }
+        }
+
+
+def _to_float(value):
+    """NaN / inf を None に変換（JSONに出力できる値にする）"""
+    value = float(value)
+    return value if np.isfinite(value) else None
@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+
+from services.metrics import metrics
+from services.profiling import is_profiling
+
+
+class ModelRegistry:
+    """学習済みモデル（スケーラー＋回帰モデル）を学習データのキーごとに保持するレジストリ
+
+    キーには学習データを特定する情報（ティッカー・予測日数・学習期間・行数など）を含めるため、
+    新しい学習行が増えない限り同じモデルが再利用され、予測は推論だけで済む。
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._models = OrderedDict()
+
+    def get(self, key):
+        """学習済みモデルを取得（未登録の場合は None）"""
+        with self._lock:
+            fitted = self._models.get(key)
+            if fitted is not None:
+                self._models.move_to_end(key)
+            return fitted
+
+    def put(self, key, fitted):
+        """学習済みモデルを登録し、上限を超えた場合は最も古く使われたものから削除"""
+        with self._lock:
+            self._models[key] = fitted
+            self._models.move_to_end(key)
+            while len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+
+    def get_or_fit(self, key, fit):
+        """登録済みのモデルを返し、なければ fit() で学習して登録"""
+        if is_profiling():
+            return fit()  # プロファイリング中は学習のコストを測るため再利用・登録しない
+        fitted = self.get(key)
+        metrics.inc("nikkei_cache_requests_total", cache="models", result="miss" if fitted is None else "hit")
+        if fitted is None:
+            fitted = fit()
+            self.put(key, fitted)
+        return fitted
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._models)
+
+
+# プロセス全体で共有するレジストリ
+model_registry = ModelRegistry()
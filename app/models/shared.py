@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import struct
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 共有ファイルの識別子と形式のバージョン（レイアウトを変えた場合に上げる）
+SHARED_MAGIC = b"NKSF"
+SHARED_FORMAT_VERSION = 1
+
+# 配列の開始位置の境界（バイト）
+SHARED_ALIGN = 64
+
+# 固定長ヘッダー: 識別子, 形式のバージョン, 予備, データのバージョン, ヘッダーJSONのバイト数
+_PREFIX = struct.Struct("<4sHHII")
+
+
+def _default_root():
+    """共有ファイルの保存先（tmpfs の /dev/shm があればメモリ上に置く）"""
+    if os.environ.get("NIKKEI_SHARED_DIR"):
+        return Path(os.environ["NIKKEI_SHARED_DIR"])
+    if Path("/dev/shm").is_dir():
+        return Path("/dev/shm") / "nikkei225"
+    return Path(__file__).resolve().parent.parent / "data" / "shared"
+
+
+def frame_digest(frame, *extra):
+    """データフレームの内容（インデックス・列名・値）から決まるキー"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((list(frame.columns), len(frame)) + extra).encode("utf-8"))
+    digest.update(np.ascontiguousarray(frame.index.values.astype("datetime64[ns]").view("int64")).tobytes())
+    digest.update(np.ascontiguousarray(frame.to_numpy(dtype="float64")).tobytes())
+    return digest.hexdigest()
+
+
+class SharedFrameStore:
+    """日付インデックスの数値データフレームを、複数プロセスでメモリマップして共有するストア
+
+    1つのフレームを1ファイル（<root>/<namespace>/<キー>.nkf）に次のレイアウトで保存する:
+      - 固定長ヘッダー: 識別子 "NKSF", 形式のバージョン, データのバージョン, ヘッダーJSONのバイト数
+      - ヘッダーJSON  : 行数・列名・インデックス名
+      - int64 × 行数         : 日付（datetime64[ns]）
+      - float64 × 行数 × 列数 : 値（行優先）
+    配列は SHARED_ALIGN バイト境界に置く。キーは内容から決まり、書き込みは一時ファイルからの置き換えで
+    行うため、読み込み側は常に完全なファイルを参照する。ヘッダーのバージョンが一致しないファイルは無視する。
+    読み込んだフレームは読み取り専用のメモリマップをそのまま参照する（コピーしない）。
+    """
+
+    def __init__(self, namespace, version=1, root=None, max_age=4 * 24 * 60 * 60):
+        self.root = Path(root or _default_root()) / namespace
+        self.version = version
+        # この秒数より古いファイルは保存時に削除する
+        self.max_age = max_age
+
+    def _path(self, key):
+        return self.root / f"{key}.nkf"
+
+    def load(self, key):
+        """保存済みのフレームをメモリマップで読み込む（存在しない・バージョン違いの場合は None）"""
+        try:
+            buffer = np.memmap(self._path(key), dtype=np.uint8, mode="r")
+        except (OSError, ValueError):
+            return None
+
+        try:
+            magic, format_version, _, version, header_size = _PREFIX.unpack_from(buffer, 0)
+            if magic != SHARED_MAGIC or format_version != SHARED_FORMAT_VERSION or version != self.version:
+                return None
+            header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_size]))
+            rows, columns = header["rows"], header["columns"]
+
+            offset = self._align(_PREFIX.size + header_size)
+            dates = buffer[offset:offset + 8 * rows].view("<i8")
+            offset = self._align(offset + 8 * rows)
+            values = buffer[offset:offset + 8 * rows * len(columns)].view("<f8").reshape(rows, len(columns))
+        except (struct.error, ValueError, KeyError) as e:
+            print(f"共有データの読み込みエラー ({key}): {e}")
+            return None
+
+        index = pd.DatetimeIndex(dates.view("datetime64[ns]"), name=header.get("index_name"))
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+    def save(self, key, frame):
+        """フレームを保存し、メモリマップで読み直したフレームを返す"""
+        header = json.dumps({
+            "rows": len(frame),
+            "columns": [str(column) for column in frame.columns],
+            "index_name": frame.index.name,
+        }).encode("utf-8")
+        dates = np.ascontiguousarray(frame.index.values.astype("datetime64[ns]").view("<i8"))
+        values = np.ascontiguousarray(frame.to_numpy(dtype="<f8"))
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+        with open(tmp_path, "wb") as f:
+            f.write(_PREFIX.pack(SHARED_MAGIC, SHARED_FORMAT_VERSION, 0, self.version, len(header)))
+            f.write(header)
+            for array in (dates, values):
+                f.write(b"\0" * (self._align(f.tell()) - f.tell()))
+                f.write(array.tobytes())
+        os.replace(tmp_path, path)
+
+        self.prune()
+        shared = self.load(key)
+        return frame if shared is None else shared
+
+    def prune(self):
+        """max_age 秒より古いファイルを削除（読み込み中のメモリマップはOS側で保持される）"""
+        limit = time.time() - self.max_age
+        try:
+            paths = list(self.root.iterdir())
+        except OSError:
+            return
+        for path in paths:
+            try:
+                if path.stat().st_mtime < limit:
+                    path.unlink()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _align(offset):
+        return -(-offset // SHARED_ALIGN) * SHARED_ALIGN
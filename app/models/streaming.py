@@ -0,0 +1,356 @@
+import copy
+import math
+from collections import deque
+
+import numpy as np
+
+NaN = float('nan')
+
+
+def _div(numerator, denominator):
+    """pandas と同じく0除算を inf / NaN として扱う割り算"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(numerator) / np.float64(denominator))
+
+
+class RollingMean:
+    """rolling(window).mean() と同じ値を1本ずつ逐次計算する移動平均
+
+    pandas と同じカハン補正付きの加算・削除を再現しているため、
+    履歴全体で初期化した場合はバッチ計算とビット単位で一致する。
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.value = NaN
+        self._values = deque()
+        self._nobs = 0
+        self._neg_ct = 0
+        self._sum = 0.0
+        self._compensation_add = 0.0
+        self._compensation_remove = 0.0
+        self._same_count = 0
+        self._prev_value = None
+
+    def update(self, x):
+        x = float(x)
+        if self._prev_value is None:
+            self._prev_value = x
+
+        self._values.append(x)
+        if len(self._values) > self.window:
+            self._remove(self._values.popleft())
+        self._add(x)
+
+        if self._nobs >= self.window and self._nobs > 0:
+            result = self._sum / self._nobs
+            if self._same_count >= self._nobs:
+                result = self._prev_value
+            elif self._neg_ct == 0 and result < 0:
+                result = 0.0
+            elif self._neg_ct == self._nobs and result > 0:
+                result = 0.0
+        else:
+            result = NaN
+        self.value = result
+        return result
+
+    def _add(self, x):
+        if x != x:
+            return
+        self._nobs += 1
+        y = x - self._compensation_add
+        t = self._sum + y
+        self._compensation_add = t - self._sum - y
+        self._sum = t
+        if math.copysign(1.0, x) < 0:
+            self._neg_ct += 1
+
+        if x == self._prev_value:
+            self._same_count += 1
+        else:
+            self._same_count = 1
+        self._prev_value = x
+
+    def _remove(self, x):
+        if x != x:
+            return
+        self._nobs -= 1
+        y = -x - self._compensation_remove
+        t = self._sum + y
+        self._compensation_remove = t - self._sum - y
+        self._sum = t
+        if math.copysign(1.0, x) < 0:
+            self._neg_ct -= 1
+
+
+class RollingStd:
+    """rolling(window).std() と同じ値を逐次計算する移動標準偏差（ウェルフォード法）"""
+
+    def __init__(self, window, ddof=1):
+        self.window = window
+        self.ddof = ddof
+        self.value = NaN
+        self._values = deque()
+        self._nobs = 0.0
+        self._mean = 0.0
+        self._ssqdm = 0.0
+        self._compensation_add = 0.0
+        self._compensation_remove = 0.0
+        self._same_count = 0
+        self._prev_value = None
+
+    def update(self, x):
+        x = float(x)
+        if self._prev_value is None:
+            self._prev_value = x
+
+        self._values.append(x)
+        if len(self._values) > self.window:
+            self._remove(self._values.popleft())
+        self._add(x)
+
+        if self._nobs >= max(self.window, 1) and self._nobs > self.ddof:
+            if self._nobs == 1 or self._same_count >= self._nobs:
+                variance = 0.0
+            else:
+                variance = self._ssqdm / (self._nobs - self.ddof)
+            result = math.sqrt(variance) if variance >= 0 else 0.0
+        else:
+            result = NaN
+        self.value = result
+        return result
+
+    def _add(self, x):
+        if x != x:
+            return
+        self._nobs += 1
+
+        if x == self._prev_value:
+            self._same_count += 1
+        else:
+            self._same_count = 1
+        self._prev_value = x
+
+        prev_mean = self._mean - self._compensation_add
+        y = x - self._compensation_add
+        t = y - self._mean
+        self._compensation_add = t + self._mean - y
+        self._mean = self._mean + t / self._nobs
+        self._ssqdm = self._ssqdm + (x - prev_mean) * (x - self._mean)
+
+    def _remove(self, x):
+        if x != x:
+            return
+        self._nobs -= 1
+        if self._nobs:
+            prev_mean = self._mean - self._compensation_remove
+            y = x - self._compensation_remove
+            t = y - self._mean
+            self._compensation_remove = t + self._mean - y
+            self._mean = self._mean - t / self._nobs
+            self._ssqdm = self._ssqdm - (x - prev_mean) * (x - self._mean)
+        else:
+            self._mean = 0.0
+            self._ssqdm = 0.0
+
+
+class _RollingExtreme:
+    """単調デックを使った移動最大値/最小値（1本あたり償却 O(1)）"""
+
+    def __init__(self, window, is_max):
+        self.window = window
+        self.value = NaN
+        self._is_max = is_max
+        self._deque = deque()  # (位置, 値) を単調に保持
+        self._window_values = deque()
+        self._nobs = 0
+        self._position = 0
+
+    def update(self, x):
+        x = float(x)
+        position = self._position
+        self._position += 1
+
+        self._window_values.append(x)
+        if len(self._window_values) > self.window:
+            removed = self._window_values.popleft()
+            if removed == removed:
+                self._nobs -= 1
+        while self._deque and self._deque[0][0] <= position - self.window:
+            self._deque.popleft()
+
+        if x == x:
+            self._nobs += 1
+            if self._is_max:
+                while self._deque and self._deque[-1][1] <= x:
+                    self._deque.pop()
+            else:
+                while self._deque and self._deque[-1][1] >= x:
+                    self._deque.pop()
+            self._deque.append((position, x))
+
+        self.value = self._deque[0][1] if self._nobs >= self.window and self._deque else NaN
+        return self.value
+
+
+class RollingMax(_RollingExtreme):
+    """rolling(window).max() の逐次計算"""
+
+    def __init__(self, window):
+        super().__init__(window, is_max=True)
+
+
+class RollingMin(_RollingExtreme):
+    """rolling(window).min() の逐次計算"""
+
+    def __init__(self, window):
+        super().__init__(window, is_max=False)
+
+
+class EMA:
+    """ewm(span=span, adjust=False).mean() と同じ値を逐次計算する指数移動平均"""
+
+    def __init__(self, span):
+        self.span = span
+        com = (span - 1) / 2.0
+        self._alpha = 1.0 / (1.0 + com)
+        self._old_wt_factor = 1.0 - self._alpha
+        self._weighted = None
+        self._old_wt = 1.0
+        self._nobs = 0
+        self.value = NaN
+
+    def update(self, x):
+        x = float(x)
+        is_observation = x == x
+        self._nobs += is_observation
+
+        if self._weighted is None:
+            self._weighted = x
+        elif self._weighted == self._weighted:
+            self._old_wt *= self._old_wt_factor
+            if is_observation:
+                # 一定値の系列での数値誤差を避ける（pandas と同じ）
+                if self._weighted != x:
+                    weighted = self._old_wt * self._weighted + self._alpha * x
+                    self._weighted = weighted / (self._old_wt + self._alpha)
+                self._old_wt = 1.0
+        elif is_observation:
+            self._weighted = x
+
+        self.value = self._weighted if self._nobs >= 1 else NaN
+        return self.value
+
+
+class StreamingIndicators:
+    """features.build_features と同じ指標を1本ずつ逐次更新する指標エンジン
+
+    from_history で過去データから状態を構築し、以降は update で新しい日足を追加する。
+    各指標の状態はウィンドウ幅分しか持たないため、1本あたりの更新コストは履歴の長さに依存しない。
+    値は履歴全体から初期化した場合、バッチ計算とビット単位で一致する。
+    """
+
+    def __init__(self, has_high_low=True):
+        self.has_high_low = has_high_low
+        self._prev_close = None
+        self._prev_padded_close = NaN
+        self._prev_high = None
+        self._prev_low = None
+        self.bars = 0
+        self.latest = {}
+
+        self._sma = {window: RollingMean(window) for window in (5, 10, 20, 50, 200)}
+        self._gain = RollingMean(14)
+        self._loss = RollingMean(14)
+        self._ema_12 = EMA(12)
+        self._ema_26 = EMA(26)
+        self._macd_signal = EMA(9)
+        self._std_20 = RollingStd(20)
+        self._volatility_20 = RollingStd(20)
+        self._high_14 = RollingMax(14)
+        self._low_14 = RollingMin(14)
+        self._stoch_d = RollingMean(3)
+        self._atr_14 = RollingMean(14)
+        self._plus_dm_14 = RollingMean(14)
+        self._minus_dm_14 = RollingMean(14)
+        self._adx = RollingMean(14)
+
+    @classmethod
+    def from_history(cls, data):
+        """過去データ全体を順に流し込んで状態を構築"""
+        engine = cls(has_high_low='High' in data and 'Low' in data)
+        columns = ['Close', 'High', 'Low'] if engine.has_high_low else ['Close']
+        for row in data[columns].itertuples(index=False):
+            engine.update(*row)
+        return engine
+
+    def update(self, close, high=None, low=None):
+        """新しい日足を追加して最新の指標値を返す"""
+        close = float(close)
+        prev_close = NaN if self._prev_close is None else self._prev_close
+        values = {'close': close}
+
+        # 移動平均
+        for window, indicator in self._sma.items():
+            values[f'sma_{window}'] = indicator.update(close)
+
+        # RSI（初日の差分は NaN だが where により 0 として扱われる）
+        delta = close - prev_close
+        gain = self._gain.update(delta if delta > 0 else 0.0)
+        loss = self._loss.update(-(delta if delta < 0 else 0.0))
+        values['rsi_14'] = 100 - (100 / (1 + _div(gain, loss)))
+
+        # MACD
+        values['ema_12'] = self._ema_12.update(close)
+        values['ema_26'] = self._ema_26.update(close)
+        values['macd'] = values['ema_12'] - values['ema_26']
+        values['macd_signal'] = self._macd_signal.update(values['macd'])
+        values['macd_hist'] = values['macd'] - values['macd_signal']
+
+        # ボリンジャーバンド
+        values['std_20'] = self._std_20.update(close)
+        values['bb_upper'] = values['sma_20'] + (values['std_20'] * 2)
+        values['bb_lower'] = values['sma_20'] - (values['std_20'] * 2)
+
+        # リターンとボラティリティ（pct_change と同じく欠損値は直前の値で埋める）
+        padded_close = close if close == close else self._prev_padded_close
+        values['returns'] = _div(padded_close, self._prev_padded_close) - 1
+        values['volatility_20'] = self._volatility_20.update(values['returns'])
+
+        # ストキャスティクス
+        high_14 = self._high_14.update(high if self.has_high_low else close)
+        low_14 = self._low_14.update(low if self.has_high_low else close)
+        values['stoch_k'] = 100 * _div(close - low_14, high_14 - low_14)
+        values['stoch_d'] = self._stoch_d.update(values['stoch_k'])
+
+        # 平均方向性指数（ADX）
+        if self.has_high_low:
+            high, low = float(high), float(low)
+            prev_high = NaN if self._prev_high is None else self._prev_high
+            prev_low = NaN if self._prev_low is None else self._prev_low
+            high_diff = high - prev_high
+            low_diff = -(low - prev_low)
+
+            true_ranges = [v for v in (high - low, abs(high - prev_close), abs(low - prev_close)) if v == v]
+            atr_14 = self._atr_14.update(max(true_ranges) if true_ranges else NaN)
+
+            plus_dm = float(high_diff > low_diff and high_diff > 0) * high_diff
+            minus_dm = float(low_diff > high_diff and low_diff > 0) * low_diff
+            values['plus_di'] = 100 * _div(self._plus_dm_14.update(plus_dm), atr_14)
+            values['minus_di'] = 100 * _div(self._minus_dm_14.update(minus_dm), atr_14)
+            dx = _div(100 * abs(values['plus_di'] - values['minus_di']), values['plus_di'] + values['minus_di'])
+            values['adx'] = self._adx.update(dx)
+
+            self._prev_high = high
+            self._prev_low = low
+
+        self._prev_close = close
+        self._prev_padded_close = padded_close
+        self.bars += 1
+        self.latest = values
+        return values
+
+    def preview(self, close, high=None, low=None):
+        """状態を変更せずに、日足を追加した場合の指標値を計算（場中の暫定値の計算用）"""
+        return copy.deepcopy(self).update(close, high, low)
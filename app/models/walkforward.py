@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class WalkForwardEvaluator:
+    """predict_trends と同じ線形回帰モデルのウォークフォワード検証
+
+    予測起点を stride 行ずつ進めながら、その時点で目的変数が確定している行だけで学習し、
+    次の stride 行を予測して実際の変化率と比較する（先読みなし）。
+    学習は十分統計量 X'X と X'y への行ブロックの加算（固定長ウィンドウの場合は減算も）で更新し、
+    各ステップでは小さな正規方程式を解くだけなので、履歴全体でも再学習のコストはほぼかからない。
+
+    StandardScaler＋LinearRegression の予測は説明変数のアフィン変換に依存しないため、
+    ここでは最初の学習期間の平均・標準偏差で固定的に標準化した値を使う（数値的な安定性のため）。
+    """
+
+    def __init__(self, horizons=(7, 30), stride=21, min_train=100, train_window=None, recent=250):
+        self.horizons = tuple(horizons)
+        self.stride = stride
+        self.min_train = min_train
+        # None の場合は拡張ウィンドウ（開始日から全期間で学習）
+        self.train_window = train_window
+        # 直近の精度を計算する予測数
+        self.recent = recent
+
+    def evaluate(self, df):
+        """設計行列（price 列と説明変数）から予測日数ごとの検証結果を返す（検証できない場合は None）"""
+        prices = df['price'].to_numpy(dtype='float64')
+        features = df.drop('price', axis=1).to_numpy(dtype='float64')
+        if len(features) < self.min_train:
+            return {h: None for h in self.horizons}
+
+        mean = features[:self.min_train].mean(axis=0)
+        scale = features[:self.min_train].std(axis=0)
+        scale[scale == 0] = 1.0
+        design = np.hstack([np.ones((len(features), 1)), (features - mean) / scale])
+
+        return {h: self._evaluate_horizon(design, prices, h) for h in self.horizons}
+
+    def _evaluate_horizon(self, design, prices, horizon):
+        rows, width = design.shape
+        target = np.full(rows, np.nan)
+        target[:rows - horizon] = prices[horizon:] / prices[:rows - horizon] - 1
+
+        xtx = np.zeros((width, width))
+        xty = np.zeros(width)
+        added = removed = 0
+        predictions, actuals = [], []
+        steps = 0
+
+        # 起点 origin の時点で目的変数が確定しているのは origin - horizon 行目まで
+        for origin in range(self.min_train + horizon - 1, rows - horizon, self.stride):
+            train_end = origin - horizon + 1
+            block = design[added:train_end]
+            xtx += block.T @ block
+            xty += block.T @ target[added:train_end]
+            added = train_end
+
+            if self.train_window is not None:
+                train_start = max(0, train_end - self.train_window)
+                block = design[removed:train_start]
+                xtx -= block.T @ block
+                xty -= block.T @ target[removed:train_start]
+                removed = max(removed, train_start)
+
+            coef = np.linalg.lstsq(xtx, xty, rcond=None)[0]
+            test = slice(origin, min(origin + self.stride, rows - horizon))
+            predictions.append(design[test] @ coef)
+            actuals.append(target[test])
+            steps += 1
+
+        if not predictions:
+            return None
+
+        predicted = np.concatenate(predictions)
+        actual = np.concatenate(actuals)
+        hits = (predicted > 0) == (actual > 0)
+        errors = predicted - actual
+
+        return {
+            "evaluations": int(len(predicted)),
+            "steps": steps,
+            "accuracy": float(hits.mean() * 100),
+            "recent_accuracy": float(hits[-self.recent:].mean() * 100),
+            "baseline_accuracy": float((actual > 0).mean() * 100),  # 常に「上昇」と予測した場合
+            "mae": float(np.abs(errors).mean() * 100),
+            "rmse": float(np.sqrt((errors ** 2).mean()) * 100)
+        }
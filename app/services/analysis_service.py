@@ -2,10 +2,17 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from models.analysis import AdvancedAnalysis
+from models.features import get_features
 
 class MarketAnalysisService:
     """総合的な市場分析サービス"""
     
+    # レスポンスの予測キーと予測日数（1回の学習でまとめて予測する）
+    PREDICTION_HORIZONS = {
+        "short_term": 7,
+        "medium_term": 30
+    }
+    
     def generate_comprehensive_analysis(self, data):
         """包括的な市場分析レポートを生成"""
         # 基本データの確認
@@ -19,9 +26,13 @@ class MarketAnalysisService:
         analyzer = AdvancedAnalysis()
         indicators = analyzer.calculate_all_indicators(data)
         
-        # AIモデルによる予測
-        short_prediction = analyzer.predict_trend(data, days_ahead=7)
-        medium_prediction = analyzer.predict_trend(data, days_ahead=30)
+        # AIモデルによる予測（全予測日数を1回の学習で計算）
+        horizon_predictions = analyzer.predict_trends(data, list(self.PREDICTION_HORIZONS.values()))
+        predictions = {
+            name: horizon_predictions[days]
+            for name, days in self.PREDICTION_HORIZONS.items()
+        }
+        short_prediction = predictions["short_term"]
         
         # 市場状況分析
         market_condition = analyzer.analyze_market_condition(data, indicators)
@@ -65,10 +76,7 @@ class MarketAnalysisService:
                 "volatility": indicators['volatility']
             },
             "market_condition": market_condition,
-            "predictions": {
-                "short_term": short_prediction,
-                "medium_term": medium_prediction
-            },
+            "predictions": predictions,
             "performance": performance,
             "trading_signals": trading_signals,
             "risk_assessment": risk_assessment,
@@ -107,7 +115,7 @@ class MarketAnalysisService:
         
         # 変動性（ボラティリティ）
         if len(data) > 20:
-            volatility_daily = data['Close'].pct_change().std() * 100
+            volatility_daily = get_features(data)['returns'].std() * 100
             volatility_annualized = volatility_daily * np.sqrt(252)
         else:
             volatility_daily = None
@@ -174,9 +182,10 @@ class MarketAnalysisService:
             signals['stochastic'] = "中立"
         
         # トレンド確認シグナル
-        sma_20 = data['Close'].rolling(window=20).mean().iloc[-1]
-        sma_50 = data['Close'].rolling(window=50).mean().iloc[-1]
-        sma_200 = data['Close'].rolling(window=200).mean().iloc[-1]
+        latest = get_features(data).iloc[-1]
+        sma_20 = latest['sma_20']
+        sma_50 = latest['sma_50']
+        sma_200 = latest['sma_200']
         
         if current_price > sma_20 and current_price > sma_50 and current_price > sma_200:
             signals['trend'] = "強い買い（すべての移動平均線の上）"
@@ -0,0 +1,282 @@
+import os
+import json
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from models.features import get_features, macd as calc_macd
+from services.signals import SignalService
+
+# 年率換算に使う年間営業日数
+TRADING_DAYS = 252
+
+# パラメータスイープの既定の探索範囲
+DEFAULT_RSI_OVERSOLD = (20, 25, 30, 35)
+DEFAULT_RSI_OVERBOUGHT = (65, 70, 75, 80)
+DEFAULT_MACD_PERIODS = ((12, 26, 9), (8, 17, 9), (5, 35, 5))
+
+
+class BacktestService:
+    """売買シグナルの過去検証（バックテスト）
+
+    各戦略は日ごとのポジション（1: 買い持ち, 0: ノーポジション）に変換され、
+    当日の終値で判断して翌日のリターンから反映される（先読みなし）。
+    取引・リターン・勝率・ドローダウン・シャープレシオはすべて配列演算で計算する。
+
+    戦略:
+      - rsi      : SignalService の RSI_Buy から holding_days 日保有
+      - macd     : SignalService の MACD_Buy から holding_days 日保有
+      - strong   : SignalService の Strong_Buy から holding_days 日保有
+      - combined : MarketAnalysisService._generate_trading_signals と同じ総合判断で
+                   「買い」で買い、「売り」で手仕舞い
+    """
+
+    STRATEGIES = ("rsi", "macd", "strong", "combined")
+
+    def __init__(self, rsi_oversold=30, rsi_overbought=70, macd_periods=(12, 26, 9),
+                 holding_days=20, cost=0.0):
+        self.signal_service = SignalService(rsi_oversold, rsi_overbought)
+        self.macd_periods = tuple(macd_periods)
+        self.holding_days = holding_days
+        # 片道あたりの取引コスト（比率、例: 0.001 = 0.1%）
+        self.cost = cost
+
+    @property
+    def params(self):
+        return {
+            "rsi_oversold": self.signal_service.rsi_oversold,
+            "rsi_overbought": self.signal_service.rsi_overbought,
+            "macd_periods": list(self.macd_periods),
+            "holding_days": self.holding_days,
+            "cost": self.cost
+        }
+
+    def run(self, data, strategies=None):
+        """指定した戦略（既定は全戦略）のバックテスト結果を返す"""
+        strategies = strategies or self.STRATEGIES
+        positions = self.positions(data, strategies)
+        close = data['Close'].to_numpy(dtype='float64')
+
+        return {
+            "start": data.index[0].strftime('%Y-%m-%d'),
+            "end": data.index[-1].strftime('%Y-%m-%d'),
+            "days": len(data),
+            "params": self.params,
+            "buy_and_hold": _buy_and_hold(close),
+            "strategies": {name: self._evaluate(close, positions[name]) for name in strategies}
+        }
+
+    def positions(self, data, strategies=None):
+        """戦略名をキーにした日ごとのポジション配列を返す"""
+        strategies = strategies or self.STRATEGIES
+        unknown = [name for name in strategies if name not in self.STRATEGIES]
+        if unknown:
+            raise ValueError(f"不明な戦略です: {', '.join(unknown)}")
+
+        features = get_features(data)
+        macd_data = self._macd(data, features)
+        positions = {}
+
+        if any(name in strategies for name in ("rsi", "macd", "strong")):
+            signals = self.signal_service.generate_buy_signals(data, features['rsi_14'], macd_data)
+            for name, column in (("rsi", "RSI_Buy"), ("macd", "MACD_Buy"), ("strong", "Strong_Buy")):
+                if name in strategies:
+                    positions[name] = self._hold_after(signals[column].to_numpy(dtype=bool))
+
+        if "combined" in strategies:
+            positions["combined"] = self._combined_position(data, features, macd_data)
+
+        return positions
+
+    def _macd(self, data, features):
+        """MACD とシグナル（既定の期間なら特徴量フレームを再利用）"""
+        if self.macd_periods == (12, 26, 9):
+            macd_line, signal = features['macd'], features['macd_signal']
+        else:
+            macd_line, signal, _ = calc_macd(data['Close'], *self.macd_periods)
+        return pd.DataFrame({'MACD': macd_line, 'Signal': signal})
+
+    def _hold_after(self, entries):
+        """シグナル発生日から holding_days 日間ポジションを持つ（保有中の新しいシグナルで延長）"""
+        last_signal = np.where(entries, np.arange(len(entries)), -1)
+        np.maximum.accumulate(last_signal, out=last_signal)
+        return ((last_signal >= 0) & (np.arange(len(entries)) - last_signal < self.holding_days)).astype('float64')
+
+    def _combined_position(self, data, features, macd_data):
+        """_generate_trading_signals の個別シグナルと総合判断を全日付について計算し、ポジションに変換"""
+        price = data['Close'].to_numpy(dtype='float64')
+        rsi = features['rsi_14'].to_numpy()
+        macd_line = macd_data['MACD'].to_numpy()
+        signal = macd_data['Signal'].to_numpy()
+        bb_upper = features['bb_upper'].to_numpy()
+        bb_lower = features['bb_lower'].to_numpy()
+        stoch_k = features['stoch_k'].to_numpy()
+        stoch_d = features['stoch_d'].to_numpy()
+        sma_20 = features['sma_20'].to_numpy()
+        sma_50 = features['sma_50'].to_numpy()
+        sma_200 = features['sma_200'].to_numpy()
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bb_position = (price - bb_lower) / (bb_upper - bb_lower)
+        inside_band = ~(price > bb_upper) & ~(price < bb_lower)
+        strong_stoch = (stoch_k < 20) & (stoch_d < 20) | (stoch_k > 80) & (stoch_d > 80)
+        above_all = (price > sma_20) & (price > sma_50) & (price > sma_200)
+        below_all = (price < sma_20) & (price < sma_50) & (price < sma_200)
+        golden = (price > sma_50) & (sma_50 > sma_200)
+        dead = (price < sma_50) & (sma_50 < sma_200)
+        other_trend = ~above_all & ~below_all & ~golden & ~dead
+
+        # 個別シグナルごとの（買い, 売り）判定（if/elif の優先順位を保つ）
+        votes = [
+            (rsi < self.signal_service.rsi_oversold,
+             ~(rsi < self.signal_service.rsi_oversold) & (rsi > self.signal_service.rsi_overbought)),
+            (macd_line > signal, macd_line < signal),
+            ((price < bb_lower) | inside_band & (bb_position < 0.2),
+             (price > bb_upper) | inside_band & (bb_position > 0.8)),
+            ((stoch_k < 20) & (stoch_d < 20) | ~strong_stoch & (stoch_k > stoch_d),
+             ~((stoch_k < 20) & (stoch_d < 20)) & (stoch_k > 80) & (stoch_d > 80) | ~strong_stoch & (stoch_k < stoch_d)),
+            (above_all | ~below_all & golden | other_trend & (price > sma_20),
+             below_all | ~above_all & ~golden & dead | other_trend & (price < sma_20)),
+        ]
+        buy_signals = sum(buy.astype(int) for buy, _ in votes)
+        sell_signals = sum(sell.astype(int) for _, sell in votes)
+
+        # 総合判断が「買い」で買い、「売り」で手仕舞い、それ以外はポジションを維持
+        buy = (buy_signals >= 3) & (buy_signals > sell_signals + 1)
+        sell = (sell_signals >= 3) & (sell_signals > buy_signals + 1)
+        state = np.where(buy, 1.0, np.where(sell, 0.0, np.nan))
+        return pd.Series(state).ffill().fillna(0.0).to_numpy()
+
+    def _evaluate(self, close, position):
+        """ポジション配列から成績指標を計算"""
+        returns = np.zeros(len(close))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[1:] = close[1:] / close[:-1] - 1
+        returns = np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+        # 前日の終値で持っていたポジションが当日のリターンを受け取る
+        held = np.zeros(len(position))
+        held[1:] = position[:-1]
+        turnover = np.abs(np.diff(position, prepend=0.0))
+        strategy = held * returns - turnover * self.cost
+
+        equity = np.cumprod(1 + strategy)
+        drawdown = equity / np.maximum.accumulate(equity) - 1
+
+        # 取引ごとのリターン（エントリーごとに番号を振り、保有日の対数リターンを合計）
+        entries = (position > 0) & (np.diff(position, prepend=0.0) > 0)
+        trade_ids = np.zeros(len(position), dtype='int64')
+        trade_ids[1:] = np.cumsum(entries)[:-1]
+        in_trade = held > 0
+        trades = int(entries.sum())
+        gross = np.bincount(
+            trade_ids[in_trade], weights=np.log1p(returns[in_trade]), minlength=trades + 1
+        )[1:]
+        trade_returns = np.expm1(gross) - 2 * self.cost
+
+        volatility = strategy.std(ddof=1) if len(strategy) > 1 else 0.0
+        sharpe = strategy.mean() / volatility * np.sqrt(TRADING_DAYS) if volatility > 0 else None
+        years = len(close) / TRADING_DAYS
+
+        return {
+            "trades": trades,
+            "total_return": (equity[-1] - 1) * 100,
+            "annualized_return": (equity[-1] ** (1 / years) - 1) * 100 if years > 0 and equity[-1] > 0 else None,
+            "hit_rate": float((trade_returns > 0).mean() * 100) if trades else None,
+            "average_trade_return": float(trade_returns.mean() * 100) if trades else None,
+            "max_drawdown": float(drawdown.min() * 100),
+            "sharpe": float(sharpe) if sharpe is not None else None,
+            "exposure": float(held.mean() * 100)
+        }
+
+    @classmethod
+    def sweep(cls, data, rsi_oversold=DEFAULT_RSI_OVERSOLD, rsi_overbought=DEFAULT_RSI_OVERBOUGHT,
+              macd_periods=DEFAULT_MACD_PERIODS, strategies=None, holding_days=20, cost=0.0,
+              max_workers=None):
+        """パラメータの全組み合わせをプロセスプールで並列に検証し、シャープレシオ順に返す"""
+        strategies = tuple(strategies or cls.STRATEGIES)
+        grid = [
+            dict(rsi_oversold=low, rsi_overbought=high, macd_periods=tuple(periods),
+                 holding_days=holding_days, cost=cost)
+            for low, high, periods in itertools.product(rsi_oversold, rsi_overbought, macd_periods)
+        ]
+        max_workers = max_workers or min(len(grid), os.cpu_count() or 1)
+        print(f"パラメータスイープ: {len(grid)}通り × {len(strategies)}戦略, ワーカー数={max_workers}")
+
+        # データは各ワーカーの初期化時に1回だけ渡す
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(data, strategies)) as pool:
+            chunksize = max(1, len(grid) // (max_workers * 4))
+            runs = list(pool.map(_run_worker, grid, chunksize=chunksize))
+
+        results = [
+            {"strategy": name, "params": run["params"], **metrics}
+            for run in runs for name, metrics in run["strategies"].items()
+        ]
+        results.sort(key=lambda r: r["sharpe"] if r["sharpe"] is not None else -np.inf, reverse=True)
+        return results
+
+
+def _buy_and_hold(close):
+    """比較用のバイ・アンド・ホールドの成績"""
+    returns = np.diff(close) / close[:-1]
+    equity = close / close[0]
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    volatility = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    return {
+        "total_return": (equity[-1] - 1) * 100,
+        "max_drawdown": float(drawdown.min() * 100),
+        "sharpe": float(returns.mean() / volatility * np.sqrt(TRADING_DAYS)) if volatility > 0 else None
+    }
+
+
+# プロセスプールのワーカーごとに保持するデータ
+_worker_data = None
+_worker_strategies = None
+
+
+def _init_worker(data, strategies):
+    global _worker_data, _worker_strategies
+    _worker_data = data
+    _worker_strategies = strategies
+
+
+def _run_worker(params):
+    return BacktestService(**params).run(_worker_data, _worker_strategies)
+
+
+def main(argv=None):
+    """コマンドラインからバックテストを実行（app ディレクトリで python -m services.backtest）"""
+    from services.data import StockDataService
+
+    parser = argparse.ArgumentParser(description="売買シグナルのバックテスト")
+    parser.add_argument("--period", default="max", help="データ期間（1y, 5y, 10y, max など）")
+    parser.add_argument("--strategy", action="append", choices=BacktestService.STRATEGIES,
+                        help="検証する戦略（複数指定可、既定は全戦略）")
+    parser.add_argument("--holding-days", type=int, default=20, help="シグナル発生後の保有日数")
+    parser.add_argument("--cost", type=float, default=0.0, help="片道あたりの取引コスト（比率）")
+    parser.add_argument("--sweep", action="store_true", help="RSI閾値・MACD期間のパラメータスイープを実行")
+    parser.add_argument("--workers", type=int, default=None, help="スイープのプロセス数")
+    parser.add_argument("--top", type=int, default=10, help="スイープ結果の表示件数")
+    args = parser.parse_args(argv)
+
+    data = StockDataService().get_nikkei_data(period=args.period)
+    if data.attrs.get('sample', False):
+        print("注意: 実データを取得できなかったため、サンプルデータで検証しています")
+
+    if args.sweep:
+        results = BacktestService.sweep(
+            data, strategies=args.strategy, holding_days=args.holding_days,
+            cost=args.cost, max_workers=args.workers
+        )[:args.top]
+    else:
+        results = BacktestService(holding_days=args.holding_days, cost=args.cost).run(data, args.strategy)
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
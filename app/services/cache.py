@@ -0,0 +1,113 @@
+import time
+import threading
+from collections import OrderedDict
+
+from services.metrics import metrics
+
+# 未登録を表す値（None を値としてキャッシュできるように使う）
+_missing = object()
+
+
+class _Flight:
+    """計算中のキーに対する待ち合わせ用オブジェクト"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """TTLとサイズ上限付きのスレッドセーフなキャッシュ
+
+    get_or_compute では同じキーの同時リクエストを1回の計算にまとめ（シングルフライト）、
+    後続のリクエストは先行する計算の完了を待って同じ結果を受け取る。
+    name を指定すると get_or_compute のヒット・ミス・待ち合わせの件数をメトリクスに記録する。
+    """
+
+    def __init__(self, ttl=600, maxsize=32, name=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.name = name
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (有効期限, 値)
+        self._inflight = {}  # key -> _Flight
+
+    def get(self, key, default=None):
+        """キャッシュされた値を取得（期限切れ・未登録の場合は default）"""
+        with self._lock:
+            value = self._get_locked(key, _missing)
+        if value is _missing:
+            return default
+        self._record("hit")
+        return value
+
+    def _get_locked(self, key, default):
+        item = self._items.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return default
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        """値を登録し、上限を超えた場合は最も古く使われた値から削除"""
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """キャッシュを参照し、なければ compute() の結果を登録して返す
+
+        cacheable が指定された場合、cacheable(値) が真のときだけ登録する。
+        """
+        with self._lock:
+            value = self._get_locked(key, _missing)
+            if value is not _missing:
+                self._record("hit")
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+        self._record("miss" if leader else "wait")
+
+        if not leader:
+            # 先行するリクエストの計算結果を待つ
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = compute()
+            flight.value = value
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def _record(self, result):
+        if self.name is not None:
+            metrics.inc("nikkei_cache_requests_total", cache=self.name, result=result)
+
+    def clear(self):
+        """すべての値を削除"""
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
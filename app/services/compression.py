@@ -0,0 +1,185 @@
+import os
+import re
+import gzip
+import contextvars
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from services.cache import TTLCache
+from services.metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli がない環境では gzip のみ
+    brotli = None
+
+# これより小さいレスポンスは圧縮しない（バイト数）
+COMPRESSION_MIN_SIZE = int(os.environ.get("NIKKEI_COMPRESSION_MIN_SIZE", "1024"))
+
+# ETag ごとにキャッシュする圧縮の圧縮レベル（一度だけ圧縮するため、速度より圧縮率を優先）
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# キャッシュできないレスポンス（一括分析・メトリクス・エラーなど）の圧縮レベル（毎回圧縮するため速度を優先）
+FAST_GZIP_LEVEL = 6
+FAST_BROTLI_QUALITY = 5
+
+# 圧縮するメディアタイプ（text/event-stream などのストリームは対象外で、そのまま送る）
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/vnd.nikkei-chart",
+    "text/html",
+    "text/css",
+    "text/javascript",
+    "text/plain",
+)
+
+
+def supported_encodings():
+    """利用できる圧縮方式（優先順）"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding):
+    """Accept-Encoding から圧縮方式を選ぶ（q=0 の方式は除き、同じ q 値なら brotli を優先）"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        try:
+            accepted[name.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body, encoding, fast=False):
+    """バイト列を指定された方式で圧縮（fast の場合は速度優先の圧縮レベル）"""
+    with metrics.timer("compress", encoding=encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=FAST_BROTLI_QUALITY if fast else BROTLI_QUALITY)
+        return gzip.compress(body, compresslevel=FAST_GZIP_LEVEL if fast else GZIP_LEVEL, mtime=0)
+
+
+def encoded_etag(etag, encoding):
+    """圧縮後の表現の ETag（強い ETag は表現ごとに異なる値にする）"""
+    return f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else etag
+
+
+def strip_encoding(etag):
+    """encoded_etag で付けた圧縮方式の接尾辞を取り除く"""
+    for encoding in ("br", "gzip"):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+class CompressionMiddleware:
+    """レスポンスを brotli / gzip で圧縮するASGIミドルウェア
+
+    一度に送られるレスポンス本体のうち、minimum_size 以上で圧縮対象のメディアタイプのものを圧縮する。
+    ETag 付きのレスポンス（スナップショットから返すレポート）は内容が ETag で決まるため、
+    圧縮結果を (ETag, 方式) ごとにキャッシュし、同じ内容は一度だけ高い圧縮レベルで圧縮する。
+    ETag のないレスポンスは速度優先の圧縮レベルで圧縮する。圧縮はイベントループを塞がないようスレッドで行う。
+    圧縮対象外のメディアタイプ（Server-Sent Events など）と分割して送られるレスポンス（大きな静的ファイル）はそのまま返す。
+    圧縮対象のメディアタイプのレスポンスには、実際に圧縮したかどうかによらず Vary: Accept-Encoding を付ける。
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE, cache_size=256):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = TTLCache(ttl=24 * 60 * 60, maxsize=cache_size, name="compressed")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, self._send_with_vary(send))
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                if message["status"] != 304 and not self._compressible_type(Headers(raw=message["headers"])):
+                    # 圧縮しないレスポンスはヘッダーをすぐに送る（ストリームの接続を遅らせないため）
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+
+            passthrough = True
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            etag = headers.get("etag")
+            # 圧縮しなかった場合も、Accept-Encoding によって表現が変わることをキャッシュに伝える
+            vary = self._compressible_type(headers)
+
+            if start["status"] == 304:
+                # クライアントが圧縮後の ETag で問い合わせた場合はその表現の ETag を返す
+                if etag and encoded_etag(etag, encoding) in request_headers.get("if-none-match", ""):
+                    headers["ETag"] = encoded_etag(etag, encoding)
+            elif self._should_compress(headers, body, message.get("more_body", False)):
+                if etag and start["status"] == 200:
+                    key = (etag, encoding)
+                    cached = self.cache.get(key)
+                    if cached is None:
+                        cached = await self._in_thread(self.cache.get_or_compute, key, lambda: compress(body, encoding))
+                    body = cached
+                    headers["ETag"] = encoded_etag(etag, encoding)
+                else:
+                    body = await self._in_thread(compress, body, encoding, True)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                message = {**message, "body": body}
+            if vary:
+                headers.add_vary_header("Accept-Encoding")
+
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    def _send_with_vary(self, send):
+        """圧縮しないクライアントへのレスポンスにも、圧縮対象のメディアタイプであれば Vary を付ける"""
+        async def send_with_vary(message):
+            if message["type"] == "http.response.start" and self._compressible_type(Headers(raw=message["headers"])):
+                headers = MutableHeaders(raw=list(message["headers"]))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "headers": headers.raw}
+            await send(message)
+        return send_with_vary
+
+    @staticmethod
+    async def _in_thread(fn, *args):
+        # Server-Timing の記録先を引き継ぐため、コンテキストをコピーして実行する
+        return await run_in_threadpool(contextvars.copy_context().run, fn, *args)
+
+    @staticmethod
+    def _compressible_type(headers):
+        media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return media_type in COMPRESSIBLE_TYPES and "content-encoding" not in headers
+
+    def _should_compress(self, headers, body, more_body):
+        if more_body or len(body) < self.minimum_size:
+            return False
+        return self._compressible_type(headers)
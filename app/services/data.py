@@ -1,8 +1,76 @@
 import yfinance as yf
 import pandas as pd
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, time as dtime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import json
+import os
+import time
+import threading
+import contextvars
+
+from services.store import PriceStore
+from services.cache import TTLCache
+from services.metrics import metrics
+
+# 期間ごとの日数（"max" は MAX_START_DATE から）
+PERIOD_DAYS = {
+    "1mo": 30,
+    "3mo": 90,
+    "6mo": 180,
+    "1y": 365,
+    "2y": 365 * 2,
+    "5y": 365 * 5,
+    "10y": 365 * 10,
+}
+MAX_START_DATE = datetime(1990, 1, 1)
+
+# 東京市場の時間帯（夏時間がないため固定オフセットで扱う）と大引けの時刻
+JST = timezone(timedelta(hours=9), "JST")
+MARKET_CLOSE = os.environ.get("NIKKEI_MARKET_CLOSE", "15:30")
+
+# Yahoo Financeから取得して保持する列
+YAHOO_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# 全エンドポイントで共有するプロセス内キャッシュ（キー: ティッカー, 期間, 取得の終了日, ストアの最終日）
+_data_cache = TTLCache(
+    ttl=int(os.environ.get("NIKKEI_DATA_CACHE_TTL", "600")),
+    maxsize=int(os.environ.get("NIKKEI_DATA_CACHE_SIZE", "32")),
+    name="data",
+)
+
+# 一括取得時に休場日の違いを前日値で埋める最大日数
+PANEL_FILL_LIMIT = 5
+
+# yf.download はモジュール共有の状態を持つため、一括取得は同時に1つだけ実行する
+_download_lock = threading.Lock()
+
+# 複数のデータソースを並行して試すためのスレッドプール
+_source_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="nikkei-source")
+
+
+def _parse_time(value):
+    hour, minute = value.split(":")
+    return int(hour), int(minute)
+
+
+def last_close(now=None, close_time=MARKET_CLOSE):
+    """直近の大引けの日時（JST）。これ以降に確認したストアには確定済みの日足がすべて含まれる"""
+    now = (now or datetime.now(JST)).astimezone(JST)
+    hour, minute = _parse_time(close_time)
+    close = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if close > now:
+        close -= timedelta(days=1)
+    return close
+
+
+def fetch_end(now=None, close_time=MARKET_CLOSE):
+    """日足の取得の終了日（この日を含まない）
+
+    大引け前は場中の未確定の日足を含めないよう当日、大引け後は当日の日足を含めるよう翌日とする。
+    """
+    return datetime.combine(last_close(now, close_time).date() + timedelta(days=1), dtime())
+
 
 class StockDataService:
     def __init__(self):
@@ -13,101 +81,403 @@ class StockDataService:
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        # ディスク上の価格ストア（過去の日足は変化しないため再ダウンロードを避ける）
+        self.store = PriceStore()
+        # 取得モード: "hedged"（遅延時にバックアップを並行起動）または "sequential"（順番に試す）
+        self.fetch_mode = os.environ.get("NIKKEI_FETCH_MODE", "hedged")
+        # プライマリを単独で待つ秒数と、全ソースを合わせた取得期限（秒）
+        self.hedge_delay = float(os.environ.get("NIKKEI_HEDGE_DELAY", "1.5"))
+        self.fetch_deadline = float(os.environ.get("NIKKEI_FETCH_DEADLINE", "20"))
+    
+    @staticmethod
+    def _period_start(period, end_date):
+        """期間から開始日を計算（不明な期間は1年）"""
+        if period == "max":
+            return MAX_START_DATE
+        return end_date - timedelta(days=PERIOD_DAYS.get(period, 365))
     
     def get_nikkei_data(self, period="1y"):
-        """日経平均の株価データを取得"""
+        """日経平均の株価データを取得
+        
+        同じ取引日・期間の結果はプロセス内でキャッシュされ、同時リクエストは1回の取得にまとめられる。
+        キーには価格ストアの最終日を含めるため、他のワーカーやスナップショット作成がストアを更新すると再取得する。
+        返されるデータフレームはリクエスト間で共有されるため、変更しないこと。
+        """
+        key = (self.ticker, period, fetch_end().date(), self.last_date())
+        return _data_cache.get_or_compute(
+            key,
+            lambda: self._fetch_nikkei_data(period),
+            # サンプルデータはキャッシュせず、次のリクエストで再取得を試みる
+            cacheable=lambda data: not data.attrs.get('sample', False)
+        )
+    
+    def _fetch_nikkei_data(self, period="1y"):
+        """日経平均の株価データをストアまたは外部ソースから取得"""
         try:
             # 期間から日付範囲を計算
-            end_date = datetime.now()
-            if period == "1mo":
-                start_date = end_date - timedelta(days=30)
-            elif period == "3mo":
-                start_date = end_date - timedelta(days=90)
-            elif period == "6mo":
-                start_date = end_date - timedelta(days=180)
-            elif period == "1y":
-                start_date = end_date - timedelta(days=365)
-            elif period == "2y":
-                start_date = end_date - timedelta(days=365*2)
-            elif period == "5y":
-                start_date = end_date - timedelta(days=365*5)
-            elif period == "10y":
-                start_date = end_date - timedelta(days=365*10)
-            elif period == "max":
-                start_date = datetime(1990, 1, 1)
-            else:
-                start_date = end_date - timedelta(days=365)
+            end_date = fetch_end()
+            start_date = self._period_start(period, end_date)
             
-            start_str = start_date.strftime('%Y-%m-%d')
-            end_str = end_date.strftime('%Y-%m-%d')
+            print(f"検索期間: {start_date.strftime('%Y-%m-%d')} から {end_date.strftime('%Y-%m-%d')}")
             
-            print(f"検索期間: {start_str} から {end_str}")
-            
-            # YFinance APIを使用する場合は期間パラメータを直接使用
-            print(f"Yahoo Finance API経由でティッカー {self.ticker} からデータ取得を試みています...")
-            data = yf.download(self.ticker, start=start_str, end=end_str)
+            # 優先順位順のデータソース（プライマリ → バックアップティッカー → Stooq）
+            sources = [(self.ticker, lambda: self._fetch_primary(start_date, end_date))]
+            for backup in self.backup_tickers:
+                sources.append((backup, lambda backup=backup: self._fetch_yahoo(backup, start_date, end_date)))
+            sources.append(("stooq", lambda: self._fetch_stooq(start_date, end_date)))
+            sources = [(name, self._timed_source(name, fetch)) for name, fetch in sources]
             
-            print(f"取得データサイズ: {len(data)}")
+            if self.fetch_mode == "sequential":
+                source, data = self._fetch_sequential(sources)
+            else:
+                source, data = self._fetch_hedged(sources)
             
-            if len(data) > 0:
+            if data is not None:
+                # モデルレジストリなどがデータの出所を識別できるよう、実際に採用したソースを記録する
+                # （バックアップのデータで学習したモデルをプライマリのものとして再利用しないため）
+                data.attrs['ticker'] = source
                 return data
             
-            # 最初の方法が失敗した場合、バックアップティッカーを試す
-            for backup in self.backup_tickers:
-                print(f"バックアップティッカー {backup} からデータ取得を試みています...")
-                data = yf.download(backup, period=period)
-                if len(data) > 0:
-                    return data
-            
-            # 方法2: Stooq.comからデータ取得
-            print("代替ソースからデータ取得を試みています...")
-            try:
-                # Stooq.comのCSVエンドポイント
-                start_str_stooq = start_date.strftime('%Y%m%d')  # Stooq用フォーマット（YYYYMMDDが必要）
-                end_str_stooq = end_date.strftime('%Y%m%d')  # Stooq用フォーマット
-                url = f"https://stooq.com/q/d/l/?s=^nkx&d1={start_str_stooq}&d2={end_str_stooq}&i=d"
-                
-                print(f"Stooqからデータ取得: {url}")
-                df = pd.read_csv(url)
-                if len(df) > 0:
-                    df['Date'] = pd.to_datetime(df['Date'])
-                    df.set_index('Date', inplace=True)
-                    df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
-                    print(f"Stooqからデータ取得成功: {len(df)}行")
-                    return df
-            except Exception as e:
-                print(f"Stooqからのデータ取得エラー: {e}")
-            
             # すべての方法が失敗した場合
             print("すべてのデータソースからの取得に失敗。サンプルデータを生成します。")
+            metrics.inc("nikkei_fallback_total", kind="sample_data")
             return self._get_sample_data(period)
             
         except Exception as e:
             print(f"データ取得エラー: {e}")
+            metrics.inc("nikkei_fallback_total", kind="sample_data")
             return self._get_sample_data(period)
     
+    @staticmethod
+    def _timed_source(name, fetch):
+        """データソースの取得1回ごとの所要時間と結果をメトリクスに記録する関数を返す"""
+        def timed_fetch():
+            result = "error"
+            try:
+                with metrics.timer("fetch", source=name):
+                    data = fetch()
+                result = "success" if data is not None and len(data) > 0 else "empty"
+                return data
+            finally:
+                metrics.inc("nikkei_source_attempts_total", source=name, result=result)
+        return timed_fetch
+    
+    def _fetch_sequential(self, sources):
+        """データソースを順番に試し、最初に取得できた (ソース名, データ) を返す"""
+        for name, fetch in sources:
+            data = fetch()
+            if data is not None and len(data) > 0:
+                if name != sources[0][0]:
+                    metrics.inc("nikkei_fallback_total", kind="backup_source")
+                return name, data
+        return None, None
+    
+    def _fetch_hedged(self, sources):
+        """プライマリを先行させ、hedge_delay 秒以内に取得できなければ残りのソースを並行して起動
+        
+        最初に取得できた (ソース名, データ) を採用し、残りは取り消す（実行中のものは結果を破棄）。
+        fetch_deadline 秒を過ぎた場合は (None, None) を返す。
+        """
+        deadline = time.monotonic() + self.fetch_deadline
+        (primary_name, primary_fetch), backups = sources[0], sources[1:]
+        # 取得の所要時間をリクエストの Server-Timing に記録するため、コンテキストを引き継ぐ
+        futures = {_source_pool.submit(contextvars.copy_context().run, primary_fetch): primary_name}
+        launched_backups = False
+        
+        try:
+            while futures:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                
+                # バックアップ未起動の間はヘッジ遅延までだけ待つ
+                timeout = remaining if launched_backups else min(remaining, self.hedge_delay)
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    name = futures.pop(future)
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        print(f"データソース {name} の取得エラー: {e}")
+                        continue
+                    if data is not None and len(data) > 0:
+                        print(f"データソース {name} からのデータを採用: {len(data)}行")
+                        if name != primary_name:
+                            metrics.inc("nikkei_fallback_total", kind="backup_source")
+                        return name, data
+                
+                if not launched_backups:
+                    print("プライマリからの取得が遅延または失敗。バックアップソースを並行して起動します...")
+                    for name, fetch in backups:
+                        futures[_source_pool.submit(contextvars.copy_context().run, fetch)] = name
+                    launched_backups = True
+            
+            if futures:
+                print(f"データ取得の期限（{self.fetch_deadline:g}秒）を超過しました")
+            return None, None
+        finally:
+            for future in futures:
+                future.cancel()
+    
+    def _fetch_primary(self, start_date, end_date):
+        """ローカルストアを最新化し、期間分をスライスして返す"""
+        stored = self._refresh_store(start_date, end_date)
+        if stored is None or len(stored) == 0:
+            return None
+        data = stored.loc[start_date.strftime('%Y-%m-%d'):]
+        print(f"ローカルストアからデータ取得: {len(data)}行")
+        return data
+    
+    @staticmethod
+    def _fetch_yahoo(ticker, start_date, end_date):
+        """Yahoo Financeから日足を取得（取得できない場合は空のデータフレーム）
+        
+        yf.download はモジュール共有の状態を使うため、並行実行できる Ticker.history を使う。
+        """
+        print(f"Yahoo Finance API経由でティッカー {ticker} からデータ取得を試みています...")
+        data = yf.Ticker(ticker).history(
+            start=start_date.strftime('%Y-%m-%d'),
+            end=end_date.strftime('%Y-%m-%d'),
+            auto_adjust=False
+        )
+        if len(data) == 0:
+            return data
+        
+        data = data[[col for col in YAHOO_COLUMNS if col in data.columns]]
+        if data.index.tz is not None:
+            data.index = data.index.tz_localize(None)
+        data.index.name = 'Date'
+        return data
+    
+    def get_intraday_quote(self):
+        """場中の最新値（当日の1分足の現在値・高値・安値）を取得（取得できない場合は None）"""
+        try:
+            bars = yf.Ticker(self.ticker).history(period="1d", interval="1m", auto_adjust=False)
+        except Exception as e:
+            print(f"場中データの取得エラー: {e}")
+            return None
+        if len(bars) == 0:
+            return None
+        
+        return {
+            "time": bars.index[-1].isoformat(),
+            "price": float(bars['Close'].iloc[-1]),
+            "high": float(bars['High'].max()),
+            "low": float(bars['Low'].min())
+        }
+    
+    @staticmethod
+    def _fetch_stooq(start_date, end_date):
+        """Stooq.comから日足を取得（取得できない場合は None）"""
+        print("代替ソースからデータ取得を試みています...")
+        try:
+            # Stooq.comのCSVエンドポイント
+            start_str_stooq = start_date.strftime('%Y%m%d')  # Stooq用フォーマット（YYYYMMDDが必要）
+            end_str_stooq = end_date.strftime('%Y%m%d')  # Stooq用フォーマット
+            url = f"https://stooq.com/q/d/l/?s=^nkx&d1={start_str_stooq}&d2={end_str_stooq}&i=d"
+            
+            print(f"Stooqからデータ取得: {url}")
+            df = pd.read_csv(url)
+            if len(df) > 0:
+                df['Date'] = pd.to_datetime(df['Date'])
+                df.set_index('Date', inplace=True)
+                df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+                print(f"Stooqからデータ取得成功: {len(df)}行")
+                return df
+        except Exception as e:
+            print(f"Stooqからのデータ取得エラー: {e}")
+        return None
+    
+    def last_date(self, ticker=None):
+        """価格ストアに保存済みの最終日（'YYYY-MM-DD', 未保存の場合は None）"""
+        return (self.store.meta(ticker or self.ticker) or {}).get('last_date')
+    
+    def refresh_store(self, period="max"):
+        """最終確認日時によらずストアの差分を取得し、保存済みの最終日を返す
+        
+        大引け直後は当日の日足がまだ配信されていない場合があるため、スナップショット作成時に再確認する。
+        """
+        end_date = fetch_end()
+        self._refresh_store(self._period_start(period, end_date), end_date, force=True)
+        return self.last_date()
+    
+    def _refresh_store(self, start_date, end_date, ticker=None, force=False):
+        """ローカルストアを最新化して全期間のデータを返す（取得できない場合は None）
+        
+        保存済みの期間が開始日をカバーしていれば、最終日以降の差分だけを取得して追記する。
+        カバーしていない場合のみ期間全体をダウンロードする。
+        """
+        ticker = ticker or self.ticker
+        try:
+            fetch_start = self._store_fetch_start(ticker, start_date, end_date, force)
+            if fetch_start is None:
+                return self.store.load(ticker)
+            
+            if fetch_start > start_date:
+                print(f"差分データを取得: {fetch_start.strftime('%Y-%m-%d')} から {end_date.strftime('%Y-%m-%d')}")
+            data = self._fetch_yahoo(ticker, fetch_start, end_date)
+            print(f"取得データサイズ: {len(data)}")
+            
+            if len(data) == 0:
+                if fetch_start <= start_date:
+                    return None
+                # 休場日または一時的な取得失敗。保存済みデータを返し、次回再確認する
+                return self.store.load(ticker)
+            return self.store.save(ticker, data, covered_from=fetch_start)
+        except Exception as e:
+            print(f"ローカルストア更新エラー: {e}")
+            return None
+    
+    def _store_fetch_start(self, ticker, start_date, end_date, force=False):
+        """ストアを最新にするために取得が必要な開始日を返す（取得不要な場合は None）"""
+        meta = self.store.meta(ticker)
+        
+        # 保存済みの期間が要求された開始日をカバーしているか（週末・祝日分の余裕を持たせる）
+        # ソースにそれより前のデータがない場合は、取得済みの開始日（covered_from）でカバーを判定する
+        covered_from = meta and (meta.get('covered_from') or meta.get('first_date'))
+        covered = (
+            covered_from is not None
+            and datetime.strptime(covered_from, '%Y-%m-%d') <= start_date + timedelta(days=7)
+        )
+        if not covered:
+            return start_date
+        
+        # 直近の大引け以降に確認済みなら、確定した新しい日足は存在しない
+        checked_at = datetime.fromisoformat(meta['checked_at'])
+        if checked_at.tzinfo is None:
+            checked_at = checked_at.astimezone()  # タイムゾーンなしの値はサーバーのローカル時刻
+        if not force and checked_at >= last_close():
+            return None
+        
+        # 最終日の翌日から差分のみ取得
+        delta_start = datetime.strptime(meta['last_date'], '%Y-%m-%d') + timedelta(days=1)
+        if delta_start.date() >= end_date.date():
+            self.store.touch(ticker)
+            return None
+        return delta_start
+    
+    def get_panel_data(self, tickers, period="1y"):
+        """複数ティッカーの日足を取得し、項目ごとの「日付×ティッカー」行列にまとめて返す
+        
+        戻り値は ({'Close': DataFrame, 'High': ..., ...}, 取得できなかったティッカーのリスト)。
+        ストアが最新のティッカーはディスクから読み込み、それ以外は yf.download でまとめて取得する。
+        返されるデータフレームはリクエスト間で共有されるため、変更しないこと。
+        """
+        tickers = list(dict.fromkeys(tickers))
+        key = ("panel", tuple(tickers), period, fetch_end().date())
+        return _data_cache.get_or_compute(
+            key,
+            lambda: self._fetch_panel_data(tickers, period),
+            # 一部でも取得できなかった場合はキャッシュせず、次のリクエストで再取得を試みる
+            cacheable=lambda result: not result[1]
+        )
+    
+    def _fetch_panel_data(self, tickers, period):
+        end_date = fetch_end()
+        start_date = self._period_start(period, end_date)
+        
+        # 取得開始日ごとにティッカーをまとめる（通常は全ティッカーが同じ差分開始日になる）
+        frames = {}
+        groups = {}
+        for ticker in tickers:
+            try:
+                fetch_start = self._store_fetch_start(ticker, start_date, end_date)
+            except Exception as e:
+                print(f"ローカルストア確認エラー ({ticker}): {e}")
+                fetch_start = start_date
+            if fetch_start is None:
+                frames[ticker] = self.store.load(ticker)
+            else:
+                groups.setdefault(fetch_start, []).append(ticker)
+        
+        for fetch_start, group in groups.items():
+            try:
+                downloaded = self._download_yahoo(group, fetch_start, end_date)
+            except Exception as e:
+                print(f"一括取得エラー: {e}")
+                downloaded = {}
+            for ticker in group:
+                try:
+                    if ticker in downloaded:
+                        frames[ticker] = self.store.save(ticker, downloaded[ticker], covered_from=fetch_start)
+                    else:
+                        # 休場日または一時的な取得失敗。保存済みデータがあればそれを使う
+                        frames[ticker] = self.store.load(ticker)
+                except Exception as e:
+                    print(f"ローカルストア更新エラー ({ticker}): {e}")
+                    frames[ticker] = None
+        
+        start_key = start_date.strftime('%Y-%m-%d')
+        available = {}
+        for ticker in tickers:
+            frame = frames.get(ticker)
+            if frame is not None and len(frame) > 0:
+                frame = frame.loc[start_key:]
+                if len(frame) > 0:
+                    available[ticker] = frame
+        missing = [ticker for ticker in tickers if ticker not in available]
+        print(f"一括取得完了: {len(available)}/{len(tickers)}ティッカー")
+        
+        panel = {}
+        if available:
+            for column in YAHOO_COLUMNS:
+                series = {t: f[column] for t, f in available.items() if column in f.columns}
+                if not series:
+                    continue
+                matrix = pd.concat(series, axis=1).sort_index()
+                # 市場ごとの休場日の違いによる欠損を直前の値で埋める（上場前などの長い欠損は残す）
+                panel[column] = matrix.ffill(limit=PANEL_FILL_LIMIT)
+        return panel, missing
+    
+    @staticmethod
+    def _download_yahoo(tickers, start_date, end_date):
+        """複数ティッカーの日足を yf.download で一括取得し、ティッカーごとのデータフレームに分割
+        
+        yf.download はモジュール共有の状態を使うため、ロックで同時実行を防ぐ。
+        """
+        print(f"Yahoo Financeから{len(tickers)}ティッカーを一括取得: {start_date.strftime('%Y-%m-%d')} から")
+        with _download_lock:
+            raw = yf.download(
+                tickers,
+                start=start_date.strftime('%Y-%m-%d'),
+                end=end_date.strftime('%Y-%m-%d'),
+                group_by='ticker',
+                auto_adjust=False,
+                threads=True,
+                progress=False
+            )
+        
+        result = {}
+        if raw is None or len(raw) == 0:
+            return result
+        
+        for ticker in tickers:
+            if isinstance(raw.columns, pd.MultiIndex):
+                if ticker not in raw.columns.get_level_values(0):
+                    continue
+                frame = raw[ticker]
+            elif len(tickers) == 1:
+                frame = raw
+            else:
+                continue
+            
+            frame = frame[[col for col in YAHOO_COLUMNS if col in frame.columns]].dropna(how='all')
+            if len(frame) == 0:
+                continue
+            if frame.index.tz is not None:
+                frame.index = frame.index.tz_localize(None)
+            frame.index.name = 'Date'
+            result[ticker] = frame
+        return result
+    
     def _get_sample_data(self, period="1y"):
         """期間に応じたサンプルデータを生成"""
         # 期間に基づいて日付範囲を計算
         end = datetime.now()
         
         # 期間に基づいて開始日を設定
-        if period == "1mo":
-            start = end - timedelta(days=30)
-        elif period == "3mo":
-            start = end - timedelta(days=90)
-        elif period == "6mo":
-            start = end - timedelta(days=180)
-        elif period == "2y":
-            start = end - timedelta(days=365*2)
-        elif period == "5y":
-            start = end - timedelta(days=365*5)
-        elif period == "10y":
-            start = end - timedelta(days=365*10)
-        elif period == "max":
-            start = datetime(1990, 1, 1)
-        else:  # デフォルト1年
-            start = end - timedelta(days=365)
+        start = self._period_start(period, end)
         
         # 営業日のみの日付範囲を生成
         dates = pd.date_range(start=start, end=end, freq='B')
@@ -130,7 +500,8 @@ class StockDataService:
             'Low': [p - random.uniform(0, 200) for p in prices],
             'Close': prices,
             'Volume': [random.randint(1000000, 5000000) for _ in prices]
-        }, index=dates)
+        }, index=dates.rename('Date'))
+        df.attrs['sample'] = True
         
         return df
     
@@ -0,0 +1,56 @@
+import os
+import warnings
+
+import numpy as np
+
+# チャートに返す点数の既定値と上限
+DEFAULT_CHART_POINTS = int(os.environ.get("NIKKEI_CHART_MAX_POINTS", "500"))
+MAX_CHART_POINTS = 5000
+
+
+def lttb_indices(values, max_points):
+    """Largest-Triangle-Three-Buckets で残す行の位置を選ぶ
+
+    values は (行, 系列) の配列。先頭と末尾の行は必ず残し、残りを max_points - 2 個のバケットに分けて、
+    各バケットから「直前に選んだ点・次のバケットの平均点」と作る三角形の面積が最大の行を1つ選ぶ。
+    複数の系列は値幅で正規化し、面積の合計で選ぶため、価格と指標の形をまとめて保つ。
+    行数が max_points 以下の場合はすべての行を返す。
+    """
+    matrix = np.asarray(values, dtype="float64")
+    matrix = matrix.reshape(-1, 1) if matrix.ndim == 1 else matrix
+    rows = len(matrix)
+    if max_points >= rows or max_points < 3:
+        return np.arange(rows)
+
+    # 系列ごとに 0〜1 に正規化（欠損は 0 として扱う）
+    with warnings.catch_warnings():
+        # 全て欠損の系列（All-NaN slice の警告）は下で値幅 1 として扱う
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low = np.nanmin(matrix, axis=0)
+        span = np.nanmax(matrix, axis=0) - low
+    low = np.nan_to_num(low)
+    span = np.where(np.isfinite(span) & (span > 0), span, 1.0)
+    y = np.nan_to_num((matrix - low) / span, nan=0.0, posinf=0.0, neginf=0.0)
+    x = np.arange(rows, dtype="float64")
+
+    # 先頭と末尾を除く行を max_points - 2 個のバケットに分割（最後に末尾の行だけのバケットを追加）
+    buckets = max_points - 2
+    bounds = np.append(1 + (np.arange(buckets + 1) * (rows - 2)) // buckets, rows)
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, rows - 1
+    a = 0
+    for i in range(buckets):
+        start, end = bounds[i], bounds[i + 1]
+        next_start, next_end = bounds[i + 1], bounds[i + 2]
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean(axis=0)
+
+        # 三角形の面積（の2倍）を系列ごとに計算して合計
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end, None]) * (avg_y - y[a])
+        ).sum(axis=1)
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
@@ -0,0 +1,74 @@
+import os
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from services.profiling import profiled_call
+
+
+class ExecutorBusyError(RuntimeError):
+    """待ち行列が上限に達していて新しい処理を受け付けられない"""
+
+
+class ExecutorTimeoutError(TimeoutError):
+    """処理が制限時間内に完了しなかった"""
+
+
+class BlockingExecutor:
+    """yfinance・pandas などのブロッキング処理をイベントループ外のスレッドプールで実行
+
+    実行中＋待機中の処理数が max_pending に達した場合は ExecutorBusyError で即座に拒否し、
+    処理が timeout 秒を超えた場合は ExecutorTimeoutError を送出する。
+    タイムアウトしたスレッドは完了するまで枠を占有し続けるため、過負荷時も上限は守られる。
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, timeout=None):
+        self.max_workers = max_workers or int(
+            os.environ.get("NIKKEI_WORKER_THREADS", min(8, (os.cpu_count() or 1) + 2))
+        )
+        self.max_pending = max_pending or int(
+            os.environ.get("NIKKEI_MAX_PENDING", self.max_workers * 4)
+        )
+        self.timeout = timeout or float(os.environ.get("NIKKEI_TASK_TIMEOUT", "30"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="nikkei-worker"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        """実行中＋待機中の処理数"""
+        return self._pending
+
+    async def run(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) をスレッドプールで実行し、結果を待つ
+        
+        リクエストのコンテキスト（Server-Timing の記録先など）はスレッドに引き継ぎ、
+        プロファイリング中のリクエストであればスレッド上でプロファイラーを有効にする。
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ExecutorBusyError("サーバーが混雑しています。しばらくしてから再試行してください")
+            self._pending += 1
+
+        try:
+            future = self._executor.submit(contextvars.copy_context().run, profiled_call, fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise ExecutorTimeoutError(f"処理が{self.timeout:g}秒以内に完了しませんでした")
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self):
+        """未開始の処理を取り消してプールを停止"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,151 @@
+import os
+import asyncio
+import contextvars
+from datetime import datetime
+
+from models.streaming import StreamingIndicators
+from services.data import StockDataService
+from services.reports import to_jsonable
+from services.responses import dumps
+from services.snapshots import JST, _parse_time
+
+
+class LiveBroadcaster:
+    """場中の最新値と指標を1回だけ計算し、購読中の全クライアントへ Server-Sent Events で配信する
+
+    購読者がいる間だけバックグラウンドのタスクが動き、取引時間中は interval 秒ごとに
+    現在値を取得して StreamingIndicators で指標の暫定値を計算する。
+    前回の配信から変化した値だけを1つのイベントにまとめ、エンコード済みのバイト列を全購読者のキューに入れる。
+    接続直後のクライアントには現在の全項目を snapshot イベントで送る。
+    """
+
+    def __init__(self, executor, interval=None, open_time=None, close_time=None):
+        self.executor = executor
+        self.interval = float(interval or os.environ.get("NIKKEI_LIVE_INTERVAL", "60"))
+        self.open_time = _parse_time(open_time or os.environ.get("NIKKEI_MARKET_OPEN", "09:00"))
+        self.close_time = _parse_time(close_time or os.environ.get("NIKKEI_MARKET_CLOSE", "15:30"))
+        # 接続を維持するためのコメントを送る間隔（秒）
+        self.keepalive = 15
+        self._subscribers = set()
+        self._latest = {}
+        self._task = None
+        # 日足の履歴から作った指標エンジン（日付・ストアの最終日・場中かどうかが変わったら作り直す）
+        self._engine = None
+        self._engine_key = None
+        self._history_date = None
+        self._sample = False
+
+    def is_market_open(self, now=None):
+        """東京市場の取引時間中か（平日の open_time〜close_time, JST）"""
+        now = (now or datetime.now(JST)).astimezone(JST)
+        return now.weekday() < 5 and self.open_time <= (now.hour, now.minute) < self.close_time
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """購読を開始し、イベントを受け取るキューを返す"""
+        queue = asyncio.Queue(maxsize=32)
+        if self._latest:
+            queue.put_nowait(self._event("snapshot", self._latest))
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            # 配信タスクは特定のリクエストに属さないため、空のコンテキストで作る
+            # （接続したリクエストの Server-Timing の記録先などを引き継がないように）
+            loop = asyncio.get_running_loop()
+            self._task = contextvars.Context().run(loop.create_task, self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def events(self):
+        """1クライアント分のイベントストリーム（StreamingResponse に渡す）
+
+        切断時は StreamingResponse がジェネレーターを取り消すため、finally で購読を解除する。
+        """
+        queue = self.subscribe()
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+    async def _run(self):
+        first = True
+        while self._subscribers:
+            # 取引時間外は接続時の最新値だけを送り、以降は計算しない
+            if first or self.is_market_open():
+                try:
+                    values = await self.executor.run(self.compute)
+                    if values is not None:
+                        self.publish(values)
+                except Exception as e:
+                    print(f"ライブ配信の計算エラー: {e}")
+            first = False
+            await asyncio.sleep(self.interval)
+
+    def compute(self):
+        """最新値と指標の暫定値を計算（スレッドプールで実行）"""
+        now = datetime.now(JST)
+        data_service = StockDataService()
+        market_open = self.is_market_open(now)
+        engine_key = (now.date(), data_service.last_date(), market_open)
+        if self._engine is None or self._engine_key != engine_key:
+            data = data_service.get_nikkei_data(period="1y")
+            if data.empty:
+                return None
+            # 場中は当日の途中までの日足を場中の値で置き換えるため、前日までで状態を作る
+            # （大引け後は当日の確定した日足までで作り、チャートの最終日と揃える）
+            if market_open and data.index[-1].date() >= now.date():
+                data = data.iloc[:-1]
+            self._engine = StreamingIndicators.from_history(data)
+            self._engine_key = engine_key
+            self._sample = data.attrs.get('sample', False)
+            self._history_date = data.index[-1].strftime('%Y-%m-%d')
+
+        quote = data_service.get_intraday_quote() if market_open else None
+        if quote is not None:
+            indicators = self._engine.preview(quote["price"], quote["high"], quote["low"])
+            date = quote["time"]
+        else:
+            indicators = self._engine.latest
+            date = self._history_date
+
+        return to_jsonable({
+            "date": date,
+            "price": indicators.get("close"),
+            "rsi": indicators.get("rsi_14"),
+            "macd": indicators.get("macd"),
+            "signal": indicators.get("macd_signal"),
+            "live": quote is not None,
+            "sample": self._sample
+        })
+
+    def publish(self, values):
+        """前回から変化した値だけを全購読者に配信"""
+        changes = {key: value for key, value in values.items() if self._latest.get(key) != value}
+        if not changes:
+            return
+        self._latest = {**self._latest, **changes}
+        message = self._event("update", changes)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # 受信が追いつかないクライアントは溜まった差分を捨て、全項目を送り直す
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._event("snapshot", self._latest))
+
+    @staticmethod
+    def _event(name, data):
+        return b"event: " + name.encode("ascii") + b"\ndata: " + dumps(data) + b"\n\n"
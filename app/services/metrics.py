@@ -0,0 +1,199 @@
+import time
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# レイテンシのヒストグラムの境界（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# リクエストごとのステージの所要時間（Server-Timing ヘッダー用）。None の場合は記録しない
+_request_timings = contextvars.ContextVar("nikkei_request_timings", default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class MetricsRegistry:
+    """カウンター・ヒストグラム・ゲージを保持し、Prometheus のテキスト形式で出力するレジストリ
+
+    値はプロセスごとに保持する（複数ワーカーの場合は各ワーカーの値になる）。
+    timer で計測した時間は、リクエストの処理中であれば Server-Timing ヘッダー用にも記録する。
+    スレッドプールで実行される処理から記録するため、リクエストのコンテキストは
+    BlockingExecutor などが contextvars.copy_context() で引き継ぐ。
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}  # 名前 -> (種類, 説明)
+        self._counters = {}  # (名前, ラベル) -> 値
+        self._histograms = {}  # (名前, ラベル) -> [バケットごとの件数, 合計, 件数]
+        self._gauges = {}  # (名前, ラベル) -> 値を返す関数
+
+    def describe(self, name, kind, description):
+        self._help[name] = (kind, description)
+
+    def inc(self, name, value=1, /, **labels):
+        """カウンターを増やす"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, /, **labels):
+        """ヒストグラムに値を追加"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def gauge(self, name, fn, /, **labels):
+        """出力時に fn() の値を返すゲージを登録"""
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = fn
+
+    @contextmanager
+    def timer(self, stage, /, **labels):
+        """ブロックの所要時間を nikkei_stage_seconds と Server-Timing に記録"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("nikkei_stage_seconds", elapsed, stage=stage, **labels)
+            timings = _request_timings.get()
+            if timings is not None:
+                timings.append((stage, ",".join(str(value) for value in labels.values()), elapsed))
+
+    def timed(self, stage, /, **labels):
+        """関数の所要時間を timer で記録するデコレーター"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self):
+        """Prometheus のテキスト形式（version 0.0.4）で出力"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self._histograms.items()}
+            gauges = dict(self._gauges)
+
+        # 名前 -> [(ラベル, 行のリスト)]。系列はラベルで並べ、系列内の行（バケットの昇順, _sum, _count）は作成順のまま出力する
+        families = {}
+        for (name, labels), value in counters.items():
+            families.setdefault(name, []).append((labels, [f"{name}{_format_labels(labels)} {value:g}"]))
+        for (name, labels), (counts, total, count) in histograms.items():
+            lines = [
+                f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {bucket_count}"
+                for bound, bucket_count in zip(self.buckets, counts)
+            ]
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            families.setdefault(name, []).append((labels, lines))
+        for (name, labels), fn in gauges.items():
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            families.setdefault(name, []).append((labels, [f"{name}{_format_labels(labels)} {value:g}"]))
+
+        output = []
+        for name in sorted(families):
+            kind, description = self._help.get(name, ("untyped", ""))
+            if description:
+                output.append(f"# HELP {name} {description}")
+            output.append(f"# TYPE {name} {kind}")
+            for _, lines in sorted(families[name], key=lambda series: tuple((k, str(v)) for k, v in series[0])):
+                output.extend(lines)
+        return "\n".join(output) + "\n"
+
+
+def start_request_timings():
+    """現在のリクエストのステージ時間の記録を開始（戻り値は reset 用のトークンと記録先）"""
+    timings = []
+    return _request_timings.set(timings), timings
+
+
+def stop_request_timings(token):
+    _request_timings.reset(token)
+
+
+def server_timing_header(timings, total=None):
+    """記録したステージ時間を Server-Timing ヘッダーの値にする（同じステージ・ラベルは合計）"""
+    merged = {}
+    for stage, description, elapsed in timings:
+        merged[(stage, description)] = merged.get((stage, description), 0.0) + elapsed
+    entries = [
+        f'{stage};desc="{description}";dur={elapsed * 1000:.1f}' if description else f"{stage};dur={elapsed * 1000:.1f}"
+        for (stage, description), elapsed in merged.items()
+    ]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """リクエストごとにステージ時間の記録を開始し、Server-Timing ヘッダーとリクエスト数・時間を記録するASGIミドルウェア"""
+
+    def __init__(self, app, registry=None):
+        self.app = app
+        self.registry = registry or metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        # 静的ファイルはまとめて1つのラベルにする（ラベルの種類を抑えるため）
+        path = "/static" if path.startswith("/static/") else path
+        start = time.perf_counter()
+        token, timings = start_request_timings()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                header = server_timing_header(timings, time.perf_counter() - start)
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            stop_request_timings(token)
+            if status[0] == 404:
+                # 存在しないパスへのリクエストはまとめる（ラベルの種類を抑えるため）
+                path = "unmatched"
+            self.registry.inc("nikkei_http_requests_total", path=path, method=scope["method"], status=status[0])
+            self.registry.observe("nikkei_http_request_seconds", time.perf_counter() - start, path=path)
+
+
+# プロセス全体で共有するレジストリ
+metrics = MetricsRegistry()
+metrics.describe("nikkei_http_requests_total", "counter", "HTTPリクエスト数")
+metrics.describe("nikkei_http_request_seconds", "histogram", "HTTPリクエストの処理時間（秒）")
+metrics.describe("nikkei_stage_seconds", "histogram", "処理ステージごとの所要時間（秒）")
+metrics.describe("nikkei_cache_requests_total", "counter", "キャッシュの参照数（result: hit / miss / wait）")
+metrics.describe("nikkei_source_attempts_total", "counter", "データソースごとの取得の試行数（result: success / empty / error）")
+metrics.describe("nikkei_fallback_total", "counter", "バックアップソース・サンプルデータへのフォールバック数")
+metrics.describe("nikkei_rejected_total", "counter", "混雑・タイムアウトで 503 / 504 を返したリクエスト数")
+metrics.describe("nikkei_executor_pending", "gauge", "スレッドプールで実行中・待機中の処理数")
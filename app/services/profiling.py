@@ -0,0 +1,187 @@
+import io
+import os
+import re
+import hmac
+import time
+import marshal
+import pstats
+import cProfile
+import threading
+import contextvars
+from pathlib import Path
+
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+
+# プロファイリングを許可するトークン（未設定の場合はプロファイリングを無効にする）
+PROFILING_TOKEN = os.environ.get("NIKKEI_PROFILING_TOKEN", "")
+
+# プロファイル結果（.prof）の保存先と保持する件数
+DEFAULT_PROFILE_DIR = Path(__file__).resolve().parent.parent / "data" / "profiles"
+PROFILE_KEEP = int(os.environ.get("NIKKEI_PROFILE_KEEP", "50"))
+
+# プロファイリングの対象（ストリームは終了しないため対象外）
+PROFILE_PATH_PREFIX = "/api/nikkei/"
+PROFILE_EXCLUDED_PATHS = ("/api/nikkei/stream",)
+
+# プロファイリングのトークンを渡すヘッダー（アクセスログや履歴に残らないよう、クエリパラメーターでは受け付けない）
+PROFILE_HEADER = "x-nikkei-profile"
+
+# 結果の返し方（store: 保存してファイル名をヘッダーで返す, pstats: テキストで返す, prof: .prof をそのまま返す）
+PROFILE_OUTPUTS = ("store", "pstats", "prof")
+
+# pstats のテキストに出力する関数の数
+PROFILE_STATS_LIMIT = 60
+
+# 現在のリクエストのプロファイル（None の場合はプロファイリングしない）
+_active_profile = contextvars.ContextVar("nikkei_active_profile", default=None)
+
+
+class RequestProfile:
+    """1リクエスト分の cProfile の結果
+
+    cProfile はスレッドごとに有効にする必要があるため、スレッドプールで実行する処理
+    （BlockingExecutor.run に渡された関数）の実行中だけ、そのスレッドで有効にする。
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def call(self, fn, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.profiler.disable()
+
+    def stats_text(self, sort="cumulative", limit=PROFILE_STATS_LIMIT):
+        """pstats のテキスト（累積時間の降順）"""
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def dump(self):
+        """.prof ファイルの内容（pstats.Stats.dump_stats と同じ形式）"""
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+
+def is_profiling():
+    """現在のリクエストがプロファイリング中か（キャッシュを使わずに計算させるため）"""
+    return _active_profile.get() is not None
+
+
+def profiled_call(fn, *args, **kwargs):
+    """プロファイリング中のリクエストであれば fn をプロファイラーの下で実行する"""
+    profile = _active_profile.get()
+    if profile is None:
+        return fn(*args, **kwargs)
+    return profile.call(fn, *args, **kwargs)
+
+
+class ProfilingMiddleware:
+    """トークン付きのリクエストを1件だけ cProfile でプロファイリングするASGIミドルウェア（デバッグ用）
+
+    NIKKEI_PROFILING_TOKEN を設定した場合のみ有効で、/api/nikkei/* へのリクエストに
+    X-Nikkei-Profile ヘッダーでトークンを指定するとプロファイリングする。
+    プロファイリング中は条件付きGET・スナップショット・特徴量キャッシュ・学習済みモデルを使わずに
+    レポートを計算する（データ取得は通常どおりキャッシュを使う）。
+    結果は ?profile_output= で指定した方法で返す:
+      - store : .prof を保存し、ファイル名を X-Nikkei-Profile-File ヘッダーで返す（レスポンスは通常どおり）
+      - pstats: レスポンスの代わりに pstats のテキストを返す
+      - prof  : レスポンスの代わりに .prof をそのまま返す（snakeviz などでフレームグラフとして表示できる）
+    """
+
+    def __init__(self, app, token=PROFILING_TOKEN, root=None, keep=PROFILE_KEEP):
+        self.app = app
+        self.token = token
+        self.root = Path(root or os.environ.get("NIKKEI_PROFILE_DIR", DEFAULT_PROFILE_DIR))
+        self.keep = keep
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if not self._applies(scope):
+            await self.app(scope, receive, send)
+            return
+
+        requested = Headers(scope=scope).get(PROFILE_HEADER)
+        if not requested:
+            await self.app(scope, receive, send)
+            return
+
+        output = QueryParams(scope.get("query_string", b"")).get("profile_output", "store")
+        if not hmac.compare_digest(requested.encode("utf-8"), self.token.encode("utf-8")):
+            await JSONResponse({"detail": "プロファイリングのトークンが一致しません"}, status_code=403)(scope, receive, send)
+            return
+        if output not in PROFILE_OUTPUTS:
+            await JSONResponse({"detail": f"不明な出力形式です: {output}"}, status_code=400)(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _active_profile.set(profile)
+        start = time.perf_counter()
+        status = [None]
+
+        async def send_profiled(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if output != "store":
+                    return
+                headers = MutableHeaders(raw=list(message["headers"]))
+                headers["Cache-Control"] = "no-store"
+                headers["X-Nikkei-Profile-File"] = self._save(scope["path"], profile)
+                message = {**message, "headers": headers.raw}
+            elif output != "store":
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            _active_profile.reset(token)
+
+        elapsed = time.perf_counter() - start
+        print(f"プロファイリング: {scope['path']} ({elapsed * 1000:.1f}ms, 計測した処理 {profile.calls}件)")
+        if output == "store":
+            return
+
+        headers = {"Cache-Control": "no-store", "X-Nikkei-Profile-Status": str(status[0])}
+        if output == "pstats":
+            response = PlainTextResponse(profile.stats_text(), headers=headers)
+        else:
+            headers["Content-Disposition"] = f'attachment; filename="{self._filename(scope["path"])}"'
+            response = Response(profile.dump(), media_type="application/octet-stream", headers=headers)
+        await response(scope, receive, send)
+
+    def _applies(self, scope):
+        return (
+            bool(self.token)
+            and scope["type"] == "http"
+            and scope["path"].startswith(PROFILE_PATH_PREFIX)
+            and scope["path"] not in PROFILE_EXCLUDED_PATHS
+        )
+
+    def _filename(self, path):
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-")
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{os.getpid()}-{counter}.prof"
+
+    def _save(self, path, profile):
+        """.prof を保存してファイル名を返す（保持する件数を超えた古いファイルは削除）"""
+        filename = self._filename(path)
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            (self.root / filename).write_bytes(profile.dump())
+            for old in sorted(self.root.glob("*.prof"), key=lambda p: p.stat().st_mtime)[:-self.keep]:
+                old.unlink()
+        except OSError as e:
+            print(f"プロファイルの保存エラー: {e}")
+            return ""
+        return filename
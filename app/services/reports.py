@@ -0,0 +1,261 @@
+import math
+from datetime import datetime, date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from services.data import StockDataService
+from models.analysis import TechnicalAnalysis
+from services.signals import SignalService
+from services.analysis_service import MarketAnalysisService
+from services.downsampling import DEFAULT_CHART_POINTS, lttb_indices
+
+
+def to_jsonable(value):
+    """レポートをJSONに変換できる値に揃える
+    
+    NumPy の数値は Python の数値に、NaN / inf は None に、日付は文字列に変換する。
+    """
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        return value if math.isfinite(value) else None
+    if value is pd.NaT:
+        return None
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.ndarray):
+        return to_jsonable(value.tolist())
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def _chart_column(values):
+    """チャート用の数値列をリストに変換（NaN / inf は None）"""
+    values = np.asarray(values, dtype='float64')
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def chart_records(columns):
+    """列形式のチャートデータを日付ごとのレコードのリストに変換"""
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def build_nikkei_analysis(period, max_points=DEFAULT_CHART_POINTS):
+    """基本的な分析結果を計算
+    
+    chart_data は期間全体の系列を LTTB で max_points 点以内に間引き、列形式（{'date': [...], 'Price': [...], ...}）で返す。
+    レスポンスの形式（レコード・列・バイナリ）への変換はエンドポイント側で行う。
+    """
+    print(f"リクエストされた期間: {period}")  # デバッグ用
+
+    # データ取得
+    data_service = StockDataService()
+    data = data_service.get_nikkei_data(period=period)
+    
+    print(f"取得データ行数: {len(data)}, 期間: {data.index[0]} から {data.index[-1]}")  # デバッグ用
+    
+    if data.empty:
+        return {"message": "サンプルデータを使用しています", "sample": True}
+    
+    # 技術的分析の実施
+    analyzer = TechnicalAnalysis()
+    rsi = analyzer.calculate_rsi(data)
+    macd_data = analyzer.calculate_macd(data)
+    
+    # 最新の結果を返す
+    latest_data = {}
+    latest_data['price'] = data['Close'].iloc[-1]
+    latest_data['rsi'] = rsi.iloc[-1]
+    latest_data['macd'] = macd_data['MACD'].iloc[-1]
+    latest_data['signal'] = macd_data['Signal'].iloc[-1]
+    latest_data['date'] = data.index[-1].strftime('%Y-%m-%d')
+    
+    # チャートデータの準備（価格と指標の形を保つ行を選び、NumPyの列から直接列形式で作成する）
+    series = np.column_stack([
+        data['Close'].to_numpy(dtype='float64'),
+        rsi.to_numpy(dtype='float64'),
+        macd_data['MACD'].to_numpy(dtype='float64'),
+        macd_data['Signal'].to_numpy(dtype='float64')
+    ])
+    rows = lttb_indices(series, max_points)
+    chart_data = {
+        'date': np.datetime_as_string(data.index.values[rows], unit='D').tolist(),
+        'Price': _chart_column(series[rows, 0]),
+        'RSI': _chart_column(series[rows, 1]),
+        'MACD': _chart_column(series[rows, 2]),
+        'Signal': _chart_column(series[rows, 3])
+    }
+    
+    return {
+        "latest": latest_data,
+        "chart_data": chart_data,
+        "period": period,
+        "sample": data.attrs.get('sample', False)
+    }
+
+
+def build_market_analysis(period):
+    """市場分析レポートを計算"""
+    print(f"市場分析APIがリクエストされました: 期間={period}")
+    
+    # データ取得
+    data_service = StockDataService()
+    data = data_service.get_nikkei_data(period=period)
+    
+    print(f"データ取得完了: {len(data)}行")
+    
+    if data.empty:
+        print("空のデータフレーム - サンプルデータを返します")
+        return {
+            "message": "サンプルデータを使用しています", 
+            "sample": True,
+            "analysis": {
+                "date": datetime.now().strftime('%Y-%m-%d'),
+                "price": 30000,
+                "summary": {
+                    "signal": "中立",
+                    "confidence": "低",
+                    "short_prediction": "データなし"
+                }
+            }
+        }
+    
+    # 技術的分析の実施
+    analyzer = TechnicalAnalysis()
+    rsi = analyzer.calculate_rsi(data)
+    macd_data = analyzer.calculate_macd(data)
+    trend_data = analyzer.calculate_trend(data)
+    volatility_data = analyzer.analyze_volatility(data)
+    
+    print("分析計算完了")
+    
+    # 市場分析レポート生成
+    signal_service = SignalService()
+    analysis = signal_service.generate_market_analysis(
+        data, rsi, macd_data, trend_data, volatility_data
+    )
+    
+    print("分析レポート生成完了")
+    
+    return {
+        "analysis": analysis,
+        "sample": data.attrs.get('sample', False)
+    }
+
+
+def build_ai_analysis(period):
+    """AIによる高度な市場分析を計算"""
+    print(f"AI分析がリクエストされました: 期間={period}")
+    
+    # データ取得
+    data_service = StockDataService()
+    data = data_service.get_nikkei_data(period=period)
+    
+    print(f"AI分析: データ取得完了 ({len(data)}行)")
+    
+    if data.empty or len(data) < 50:
+        return {
+            "message": "分析に十分なデータがありません。サンプルデータを使用します。",
+            "sample": True,
+            "analysis": generate_sample_ai_analysis()
+        }
+    
+    # 市場分析サービスを使用して包括的な分析を実行
+    analysis_service = MarketAnalysisService()
+    analysis_result = analysis_service.generate_comprehensive_analysis(data)
+    
+    print("AI分析: 分析完了")
+    
+    return {
+        "analysis": analysis_result,
+        "sample": data.attrs.get('sample', False),
+        "period": period
+    }
+
+
+# スナップショットとして事前計算するレポート（エンドポイント名 → 生成関数）
+REPORTS = {
+    "nikkei_analysis": build_nikkei_analysis,
+    "market_analysis": build_market_analysis,
+    "ai_analysis": build_ai_analysis,
+}
+
+
+def generate_sample_chart_data():
+    """サンプルチャートデータを生成"""
+    import random
+    
+    data = []
+    base_price = 30000
+    base_date = datetime.now() - timedelta(days=30)
+    
+    for i in range(30):
+        date = (base_date + timedelta(days=i)).strftime('%Y-%m-%d')
+        price = base_price + random.uniform(-500, 500)
+        base_price = price
+        
+        data.append({
+            "date": date,
+            "Price": price,
+            "RSI": random.uniform(30, 70),
+            "MACD": random.uniform(-200, 200),
+            "Signal": random.uniform(-100, 100),
+            "Strong_Buy": random.random() > 0.8
+        })
+    
+    return data
+
+
+def generate_sample_ai_analysis():
+    """サンプルAI分析結果を生成"""
+    return {
+        "date": datetime.now().strftime('%Y-%m-%d'),
+        "price": 32500,
+        "indicators": {
+            "rsi": 52.5,
+            "macd": 15.3,
+            "macd_signal": 10.8,
+            "bollinger": {
+                "upper": 33000,
+                "middle": 32200,
+                "lower": 31400
+            },
+            "stochastic": {
+                "k": 65.2,
+                "d": 60.1
+            },
+            "adx": 22.5,
+            "volatility": 1.8
+        },
+        "market_condition": {
+            "market_phase": "強気相場（ブル・マーケット）",
+            "trend_strength": "中程度",
+            "volatility_state": "普通",
+            "market_sentiment": "中立"
+        },
+        "predictions": {
+            "short_term": {
+                "direction": "上昇",
+                "prediction": 1.2,
+                "confidence": 0.7
+            },
+            "medium_term": {
+                "direction": "横ばい",
+                "prediction": 0.3,
+                "confidence": 0.6
+            }
+        },
+        "recommendation": {
+            "action": "様子見",
+            "confidence": "中",
+            "explanation": "市場は強気相場の中で推移していますが、短期的な上昇予測の信頼性が限られています。様子見が推奨されます。"
+        }
+    }
+
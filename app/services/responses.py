@@ -0,0 +1,168 @@
+import os
+import json
+import struct
+import hashlib
+from pathlib import Path
+from datetime import timezone
+from email.utils import format_datetime
+
+import numpy as np
+from fastapi.responses import JSONResponse, Response
+
+from services.reports import to_jsonable, chart_records
+from services.compression import strip_encoding
+from services.metrics import metrics
+from services.profiling import is_profiling
+
+try:
+    import orjson
+except ImportError:  # orjson がない環境では標準の json で代替
+    orjson = None
+
+# 検証付きレスポンスをブラウザが再検証なしで使える最大秒数
+CACHE_MAX_AGE = int(os.environ.get("NIKKEI_CACHE_MAX_AGE", "300"))
+
+
+def _source_version():
+    """アプリのソースコードのハッシュ（デプロイで計算方法が変われば ETag も変わる）"""
+    digest = hashlib.sha256()
+    app_dir = Path(__file__).resolve().parent.parent
+    for path in sorted(app_dir.glob("**/*.py")):
+        digest.update(path.relative_to(app_dir).as_posix().encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+# ETag に含めるコードのバージョン（未指定の場合はソースコードのハッシュ）
+CODE_VERSION = os.environ.get("NIKKEI_CODE_VERSION") or _source_version()
+
+# チャートデータのレスポンス形式
+CHART_FORMATS = ("records", "columnar", "binary")
+
+# バイナリ形式のメディアタイプと先頭の識別子
+BINARY_CHART_MEDIA_TYPE = "application/vnd.nikkei-chart"
+BINARY_CHART_MAGIC = b"NKC1"
+
+
+def dumps(content):
+    """JSONバイト列に変換（NumPy 配列・数値に対応し、NaN / inf は null）"""
+    with metrics.timer("serialize"):
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            to_jsonable(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+def loads(data):
+    """JSONバイト列・文字列を読み込む"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson でシリアライズする JSONResponse
+
+    エンドポイントからこのレスポンスを直接返すと、FastAPI の jsonable_encoder による
+    辞書の再帰的な変換を経由せずにシリアライズされる。
+    """
+
+    def render(self, content):
+        return dumps(content)
+
+
+def chart_response(payload, chart_format="records"):
+    """chart_data を含むレポートを要求された形式のレスポンスにする
+
+    - records  : 日付ごとのオブジェクトの配列（従来の形式）
+    - columnar : 列ごとの配列 {"date": [...], "Price": [...], ...}
+    - binary   : encode_binary_chart の形式（chart_data がない場合は JSON）
+    """
+    chart = payload.get("chart_data")
+    if isinstance(chart, list) and chart_format != "records":
+        # レコード形式のサンプルデータなどは列形式に揃える
+        chart = {key: [row.get(key) for row in chart] for key in (chart[0] if chart else {})}
+        payload = {**payload, "chart_data": chart}
+
+    if chart_format == "binary" and isinstance(chart, dict) and chart.get("date"):
+        return Response(encode_binary_chart(payload), media_type=BINARY_CHART_MEDIA_TYPE)
+    if chart_format == "records" and isinstance(chart, dict):
+        payload = {**payload, "chart_data": chart_records(chart)}
+    return FastJSONResponse(payload)
+
+
+def encode_binary_chart(payload):
+    """列形式の chart_data をコンパクトなバイナリにエンコード
+
+    レイアウト（数値はすべてリトルエンディアン）:
+      - 4バイト   : 識別子 "NKC1"
+      - uint32    : ヘッダーJSONのバイト数 H
+      - H バイト  : ヘッダーJSON（chart_data 以外の項目と rows, columns）
+      - 0〜3バイト: 4バイト境界までのパディング
+      - int32 × rows          : 日付（1970-01-01 からの日数）
+      - float32 × rows × 列数 : columns の順に各列の値（欠損は NaN）
+    ブラウザでは Int32Array / Float32Array でコピーせずに読み込める。
+    """
+    chart = payload["chart_data"]
+    names = [name for name in chart if name != "date"]
+    header = {key: value for key, value in payload.items() if key != "chart_data"}
+    header.update(rows=len(chart["date"]), columns=names)
+    header_bytes = dumps(header)
+    padding = b"\0" * (-(len(BINARY_CHART_MAGIC) + 4 + len(header_bytes)) % 4)
+
+    dates = np.array(chart["date"], dtype="datetime64[D]").astype("<i4")
+    values = np.array([chart[name] for name in names], dtype="<f4")
+    return b"".join([
+        BINARY_CHART_MAGIC,
+        struct.pack("<I", len(header_bytes)),
+        header_bytes,
+        padding,
+        dates.tobytes(),
+        values.tobytes(),
+    ])
+
+
+class CacheValidator:
+    """ETag / Last-Modified による条件付きGETの判定とキャッシュ用ヘッダーの付与
+
+    parts はレスポンスの内容を一意に決める値の組で、CODE_VERSION とあわせてハッシュして強い ETag にする。
+    Last-Modified は取引日の大引けで、同じ取引日にスナップショットを作り直した場合（日足の配信遅れによる再試行）も
+    変わらないため、条件付きGETの判定には使わない（判定は ETag のみで行い、If-Modified-Since は無視する）。
+    """
+
+    def __init__(self, parts, last_modified, max_age=CACHE_MAX_AGE):
+        digest = hashlib.sha256(repr((CODE_VERSION,) + tuple(parts)).encode("utf-8")).hexdigest()
+        self.etag = f'"{digest[:32]}"'
+        self.last_modified = last_modified.astimezone(timezone.utc)
+        self.max_age = max(0, int(max_age))
+
+    def headers(self):
+        return {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+            "Cache-Control": f"public, max-age={self.max_age}, must-revalidate",
+        }
+
+    def is_fresh(self, request):
+        """クライアントのキャッシュが最新か（If-None-Match で判定し、If-Modified-Since は無視する）"""
+        if is_profiling():
+            return False  # プロファイリング中は常に計算する
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is None:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # GET の比較は弱い比較（W/ の有無を問わない）で、圧縮後の表現の ETag も同じ内容として扱う
+        return "*" in tags or self.etag in [strip_encoding(tag[2:] if tag.startswith("W/") else tag) for tag in tags]
+
+    def not_modified(self):
+        """304 Not Modified のレスポンス"""
+        return Response(status_code=304, headers=self.headers())
+
+    def apply(self, response, payload):
+        """レスポンスに検証子を付ける（サンプルデータはキャッシュさせない）"""
+        if payload.get("sample", False):
+            response.headers["Cache-Control"] = "no-store"
+        else:
+            response.headers.update(self.headers())
+        return response
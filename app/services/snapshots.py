@@ -0,0 +1,304 @@
+import os
+import re
+import shutil
+import argparse
+import threading
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from services.cache import TTLCache
+from services.metrics import metrics
+from services.profiling import is_profiling
+from services.data import StockDataService, PERIOD_DAYS, JST, _parse_time
+from services.reports import REPORTS, to_jsonable
+from services.responses import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # fcntl がない環境（Windows）ではワーカー間の排他を行わない
+    fcntl = None
+
+# デフォルトの保存先（app/data/snapshots）
+DEFAULT_SNAPSHOT_DIR = Path(__file__).resolve().parent.parent / "data" / "snapshots"
+
+# 事前計算する期間
+SNAPSHOT_PERIODS = tuple(PERIOD_DAYS) + ("max",)
+
+
+def next_weekday_time(now, at):
+    """now より後で最初の平日の時刻 at（(時, 分), JST）"""
+    now = (now or datetime.now(JST)).astimezone(JST)
+    run = now.replace(hour=at[0], minute=at[1], second=0, microsecond=0)
+    if run <= now:
+        run += timedelta(days=1)
+    while run.weekday() >= 5:
+        run += timedelta(days=1)
+    return run
+
+
+def market_date(now=None, close_time="15:30"):
+    """スナップショットのキーにする取引日
+
+    東京市場の大引け（close_time, JST）より前は前営業日、以降は当日とする。土日は直前の金曜日に寄せる。
+    """
+    now = (now or datetime.now(JST)).astimezone(JST)
+    day = now.date()
+    if (now.hour, now.minute) < _parse_time(close_time):
+        day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+class SnapshotService:
+    """エンドポイントのレポートを（レポート名, 期間, 取引日, データの最終日）ごとにJSONで保存し、リクエスト時は参照だけで返す
+
+    スナップショットがない場合のみその場で計算し、結果を保存して以降のリクエストで再利用する。
+    ファイルは <root>/<取引日>/<レポート名>-<期間>[-<オプション>].<データの最終日>.json に保存するため、複数ワーカーでも共有される。
+    データの最終日（価格ストアの最終日足）をキーに含めるため、大引け後に遅れて当日の日足が取得された場合も作り直される。
+    レポートのオプション（チャートの点数など）を指定した場合は、ディスクには保存せず、
+    件数に上限のあるメモリキャッシュにだけ保持する（任意の値でファイルが増え続けないように）。
+    サンプルデータによる結果は保存しない。
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or os.environ.get("NIKKEI_SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR))
+        self.close_time = os.environ.get("NIKKEI_MARKET_CLOSE", "15:30")
+        # 読み込んだスナップショットのメモリキャッシュ（キーに取引日を含むため、日付が変われば自然に切り替わる）
+        self._cache = TTLCache(ttl=24 * 60 * 60, maxsize=64, name="snapshots")
+        # 既定以外のオプションで計算したレポート（ディスクには保存しない）
+        self._variants = TTLCache(
+            ttl=24 * 60 * 60,
+            maxsize=int(os.environ.get("NIKKEI_SNAPSHOT_VARIANTS", "32")),
+            name="snapshot_variants",
+        )
+
+    def market_date(self, now=None):
+        return market_date(now, self.close_time)
+
+    def validator(self, name, period, now=None, **options):
+        """レポートを計算せずに、その内容を識別する値と最終更新日時・有効秒数を返す
+
+        スナップショットは（レポート名, 期間, 取引日, オプション）ごとに固定なので、
+        これに対象ティッカーと価格ストアの最終日足を加えた値で内容を識別できる。
+        最終更新日時は取引日の大引け（表示用で、条件付きGETの判定には使わない）、
+        有効秒数は次の大引け（取引日の切り替わり）までの秒数。
+        """
+        now = (now or datetime.now(JST)).astimezone(JST)
+        day = self.market_date(now)
+        data_service = StockDataService()
+        parts = (name, data_service.ticker, period, day.isoformat(), data_service.last_date(), self.variant(options))
+
+        close = _parse_time(self.close_time)
+        last_modified = datetime.combine(day, time(*close), JST)
+        expires_in = (next_weekday_time(now, close) - now).total_seconds()
+        return parts, last_modified, expires_in
+
+    @staticmethod
+    def variant(options):
+        """オプションからバリアントのキーを作る（None のオプションは既定値として除く）"""
+        return tuple(sorted((key, value) for key, value in options.items() if value is not None))
+
+    @staticmethod
+    def data_date():
+        """価格ストアに保存済みの最終日（スナップショットのキーに含める）"""
+        return StockDataService().last_date()
+
+    def refresh(self):
+        """価格ストアの差分を再確認し、データの最終日を返す"""
+        return StockDataService().refresh_store()
+
+    def _path(self, name, period, day, data_date, variant=()):
+        suffix = "".join(f"-{key}{value}" for key, value in variant)
+        return self.root / day.isoformat() / f"{name}-{period}{suffix}.{data_date}.json"
+
+    def load(self, name, period, day, data_date, variant=()):
+        """保存済みのスナップショットを読み込む（存在しない場合は None）"""
+        try:
+            with open(self._path(name, period, day, data_date, variant), "rb") as f:
+                return loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def save(self, name, period, day, data_date, payload, variant=()):
+        """スナップショットをアトミックに保存"""
+        path = self._path(name, period, day, data_date, variant)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+        with open(tmp_path, "wb") as f:
+            f.write(dumps(payload))
+        os.replace(tmp_path, path)
+
+    def get(self, name, period, **options):
+        """レポートを取得（メモリ → ディスク → その場で計算 の順）"""
+        variant = self.variant(options)
+        if period not in SNAPSHOT_PERIODS or is_profiling():
+            # 事前計算の対象外の期間（とプロファイリング中）は保存せずにその場で計算
+            return self._build(name, period, variant)
+
+        day = self.market_date()
+        data_date = self.data_date()
+        if variant:
+            return self._variants.get_or_compute(
+                (name, period, day, data_date, variant),
+                lambda: self._build(name, period, variant),
+                cacheable=lambda payload: not payload.get("sample", False)
+            )
+        return self._cache.get_or_compute(
+            (name, period, day, data_date, variant),
+            lambda: self._load_or_build(name, period, day, data_date, variant),
+            cacheable=lambda payload: not payload.get("sample", False)
+        )
+
+    def _load_or_build(self, name, period, day, data_date, variant=()):
+        with metrics.timer("snapshot_load", name=name):
+            payload = self.load(name, period, day, data_date, variant)
+        metrics.inc("nikkei_cache_requests_total", cache="snapshot_files", result="miss" if payload is None else "hit")
+        if payload is not None:
+            return payload
+
+        print(f"スナップショットなし: {name} {period} {dict(variant)} ({day}) - その場で計算します")
+        payload = self._build(name, period, variant)
+        if not payload.get("sample", False):
+            # 計算中にストアが更新された場合（初回の取得など）は更新後の最終日で保存する
+            self.save(name, period, day, self.data_date(), payload, variant)
+        return payload
+
+    @staticmethod
+    def _build(name, period, variant=()):
+        """レポートをその場で計算"""
+        with metrics.timer("report", name=name):
+            return to_jsonable(REPORTS[name](period, **dict(variant)))
+
+    def precompute(self, names=None, periods=None, refresh=True):
+        """全レポート×全期間のスナップショットを計算して保存し、保存できた件数を返す
+
+        refresh の場合は先に価格ストアを再確認し、当日の日足を取り込んでから計算する。
+        """
+        day = self.market_date()
+        if refresh:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"価格ストアの再確認エラー: {e}")
+        data_date = self.data_date()
+        saved = 0
+        for name in names or REPORTS:
+            for period in periods or SNAPSHOT_PERIODS:
+                try:
+                    payload = to_jsonable(REPORTS[name](period))
+                    if payload.get("sample", False):
+                        print(f"スナップショット作成スキップ（サンプルデータ）: {name} {period}")
+                        continue
+                    self.save(name, period, day, data_date, payload)
+                    self._cache.set((name, period, day, data_date, ()), payload)
+                    saved += 1
+                except Exception as e:
+                    print(f"スナップショット作成エラー: {name} {period}: {e}")
+        print(f"スナップショット作成完了: {saved}件 ({day}, データの最終日 {data_date})")
+        return saved
+
+    def prune(self, keep_days=7):
+        """keep_days 日より古い取引日のスナップショットを削除"""
+        limit = (self.market_date() - timedelta(days=keep_days)).isoformat()
+        if not self.root.exists():
+            return
+        for path in self.root.iterdir():
+            if path.is_dir() and re.fullmatch(r"\d{4}-\d{2}-\d{2}", path.name) and path.name < limit:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+class SnapshotScheduler:
+    """平日の大引け後（既定 15:45 JST）にスナップショットを事前計算するバックグラウンドスレッド
+
+    当日の日足がまだ配信されていない場合は retry_interval 秒ごとに最大 retries 回ストアを再確認し、
+    取り込めた時点でスナップショットを作り直す（祝日は日足がないため再確認だけで終わる）。
+    複数ワーカーで起動した場合も、スナップショットの保存先のロックファイルを取得できた1プロセスだけが実行する。
+    """
+
+    def __init__(self, service, run_at=None, retry_interval=None, retries=None):
+        self.service = service
+        self.run_at = _parse_time(run_at or os.environ.get("NIKKEI_SNAPSHOT_TIME", "15:45"))
+        self.retry_interval = float(retry_interval or os.environ.get("NIKKEI_SNAPSHOT_RETRY_INTERVAL", "1800"))
+        self.retries = int(retries if retries is not None else os.environ.get("NIKKEI_SNAPSHOT_RETRIES", "4"))
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock_file = None
+
+    def next_run(self, now=None):
+        """次回の実行日時（JST）"""
+        return next_weekday_time(now, self.run_at)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if not self._acquire_lock():
+            print("スナップショットの定期作成は他のワーカーが実行中のため、このワーカーでは起動しません")
+            return
+        self._thread = threading.Thread(target=self._run, name="nikkei-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._lock_file is not None:
+            # ロックはファイルを閉じると解放される
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire_lock(self):
+        """プロセス間の排他ロックを取得（プロセスが終了するとOSが解放する）"""
+        if fcntl is None:
+            return True
+        self.service.root.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.service.root / ".scheduler.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            run = self.next_run()
+            print(f"次回のスナップショット作成: {run.strftime('%Y-%m-%d %H:%M')} JST")
+            if self._stopped.wait((run - datetime.now(JST)).total_seconds()):
+                break
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"スナップショット作成エラー: {e}")
+
+    def run_once(self):
+        """スナップショットを作成し、当日の日足が揃うまで再確認する"""
+        self.service.precompute()
+        self.service.prune()
+
+        day = self.service.market_date().isoformat()
+        for _ in range(self.retries):
+            data_date = self.service.data_date()
+            if data_date is not None and data_date >= day:
+                return
+            print(f"当日の日足が未取得のため再確認します（データの最終日 {data_date}, {self.retry_interval:.0f}秒後）")
+            if self._stopped.wait(self.retry_interval):
+                return
+            if self.service.refresh() != data_date:
+                self.service.precompute(refresh=False)
+
+
+def main(argv=None):
+    """コマンドラインからスナップショットを作成（app ディレクトリで python -m services.snapshots）"""
+    parser = argparse.ArgumentParser(description="分析レポートのスナップショットを事前計算")
+    parser.add_argument("--report", action="append", choices=list(REPORTS), help="作成するレポート（既定は全レポート）")
+    parser.add_argument("--period", action="append", choices=SNAPSHOT_PERIODS, help="作成する期間（既定は全期間）")
+    parser.add_argument("--keep-days", type=int, default=7, help="保持する日数")
+    args = parser.parse_args(argv)
+
+    service = SnapshotService()
+    service.precompute(args.report, args.period)
+    service.prune(args.keep_days)
+
+
+if __name__ == "__main__":
+    main()
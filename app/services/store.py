@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # fcntl がない環境（Windows）ではプロセス内のロックのみ
+    fcntl = None
+
+# デフォルトの保存先（app/data/prices）
+DEFAULT_STORE_DIR = Path(__file__).resolve().parent.parent / "data" / "prices"
+
+# 古いリビジョンのファイルを残しておく秒数（この間は古い meta.json を読んだワーカーも読み込める）
+REVISION_GRACE = int(os.environ.get("NIKKEI_STORE_REVISION_GRACE", "3600"))
+
+
+class PriceStore:
+    """ティッカーごとの日足OHLCVをメモリマップ可能なNumPy形式でディスクに保存するストア
+
+    ティッカーごとに以下のファイルを持つ:
+      - dates-<rev>.npy  : 日付（datetime64[ns] を int64 で保存）
+      - values-<rev>.npy : 値（float64 の 行×列 行列）
+      - meta.json        : 列名・期間・最終確認日時と現在のリビジョン、取得済みの開始日（covered_from）
+    meta.json を最後にアトミックに置き換えるため、読み込み側は常に一貫したリビジョンを参照する。
+    書き込みはティッカーごとのロックファイル（.lock）の flock で複数プロセス間でも直列化する。
+    置き換えた古いリビジョンのファイルはすぐには削除せず、REVISION_GRACE 秒を過ぎてから gc で削除する。
+    """
+
+    # 同一プロセス内での同時書き込みを直列化するロック
+    _write_lock = threading.Lock()
+
+    def __init__(self, root=None):
+        self.root = Path(root or os.environ.get("NIKKEI_STORE_DIR", DEFAULT_STORE_DIR))
+
+    def _ticker_dir(self, ticker):
+        # "^N225" のような記号を含むティッカーをディレクトリ名に変換
+        return self.root / re.sub(r"[^A-Za-z0-9_.-]", "_", ticker)
+
+    def meta(self, ticker):
+        """メタ情報を取得（存在しない場合は None）"""
+        path = self._ticker_dir(ticker) / "meta.json"
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, ticker):
+        """保存済みの価格データをメモリマップで読み込む（存在しない場合は None）"""
+        meta = self.meta(ticker)
+        if meta is None:
+            return None
+
+        ticker_dir = self._ticker_dir(ticker)
+        rev = meta["revision"]
+        try:
+            dates = np.load(ticker_dir / f"dates-{rev}.npy", mmap_mode="r")
+            values = np.load(ticker_dir / f"values-{rev}.npy", mmap_mode="r")
+        except (OSError, ValueError) as e:
+            print(f"価格ストアの読み込みエラー ({ticker}): {e}")
+            return None
+
+        index = pd.DatetimeIndex(np.asarray(dates).view("datetime64[ns]"), name="Date")
+        return pd.DataFrame(values, index=index, columns=meta["columns"], copy=False)
+
+    @contextmanager
+    def _locked(self, ticker):
+        """ティッカーへの書き込みをプロセス内・プロセス間で排他する"""
+        with self._write_lock:
+            if fcntl is None:
+                yield
+                return
+            ticker_dir = self._ticker_dir(ticker)
+            ticker_dir.mkdir(parents=True, exist_ok=True)
+            with open(ticker_dir / ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, ticker, frame, covered_from=None):
+        """価格データを保存（既存データとマージし、同じ日付は新しい値で上書き）
+
+        covered_from には取得を要求した開始日を渡す。ソースにそれより前のデータがない場合（上場が後の銘柄など）も、
+        その日以降は取得済みとして記録し、同じ開始日での再ダウンロードを避ける。
+        保存後はメモリマップで読み直して返すため、取得したワーカーも他のワーカーと同じページを共有する。
+        """
+        with self._locked(ticker):
+            saved = self._save(ticker, frame, covered_from)
+            self._gc(ticker)
+        mapped = self.load(ticker)
+        return saved if mapped is None else mapped
+
+    def _save(self, ticker, frame, covered_from=None):
+        frame = self._normalize(frame)
+        old_meta = self.meta(ticker) or {}
+        existing = self.load(ticker)
+        if existing is not None and len(existing) > 0:
+            frame = pd.concat([existing, frame])
+            frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+
+        ticker_dir = self._ticker_dir(ticker)
+        ticker_dir.mkdir(parents=True, exist_ok=True)
+        rev = time.time_ns()
+
+        np.save(ticker_dir / f"dates-{rev}.npy", frame.index.values.astype("datetime64[ns]").view("int64"))
+        np.save(ticker_dir / f"values-{rev}.npy", frame.to_numpy(dtype="float64"))
+        first_date = frame.index[0].strftime("%Y-%m-%d") if len(frame) else None
+        covered = [d for d in (old_meta.get("covered_from"), covered_from and covered_from.strftime("%Y-%m-%d"), first_date) if d]
+        self._write_meta(ticker, {
+            "ticker": ticker,
+            "revision": rev,
+            "columns": list(frame.columns),
+            "rows": len(frame),
+            "first_date": first_date,
+            "covered_from": min(covered) if covered else None,
+            "last_date": frame.index[-1].strftime("%Y-%m-%d") if len(frame) else None,
+            "checked_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        })
+        return frame
+
+    def gc(self, ticker):
+        """現在のリビジョン以外で REVISION_GRACE 秒より古いファイルを削除"""
+        with self._locked(ticker):
+            self._gc(ticker)
+
+    def _gc(self, ticker):
+        meta = self.meta(ticker)
+        if meta is None:
+            return
+        limit = time.time_ns() - REVISION_GRACE * 10**9
+        for path in self._ticker_dir(ticker).glob("*-*.npy"):
+            match = re.fullmatch(r"(?:dates|values)-(\d+)\.npy", path.name)
+            if match is None:
+                continue
+            rev = int(match.group(1))
+            # 読み込み中のメモリマップはOS側で保持されるため、猶予後の削除は読み込み側に影響しない
+            if rev != meta["revision"] and rev < limit:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def touch(self, ticker):
+        """データを書き換えずに最終確認日時だけを更新"""
+        with self._locked(ticker):
+            meta = self.meta(ticker)
+            if meta is None:
+                return
+            meta["checked_at"] = datetime.now().astimezone().isoformat(timespec="seconds")
+            self._write_meta(ticker, meta)
+
+    def _write_meta(self, ticker, meta):
+        path = self._ticker_dir(ticker) / "meta.json"
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _normalize(frame):
+        """保存用にインデックスと型を揃える"""
+        frame = frame.copy()
+        index = pd.DatetimeIndex(frame.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        frame.index = index.normalize().rename("Date")
+        return frame.astype("float64")
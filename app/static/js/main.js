@@ -28,6 +28,9 @@ document.addEventListener('DOMContentLoaded', () => {
     // 初期データ取得のみ行い、AI分析は基本データ取得の完了後に実行
     fetchData('1y');
     
+    // 場中の最新値はサーバーからの配信で受け取る（ポーリングしない）
+    startLiveUpdates();
+    
     // AI分析更新ボタンのイベントリスナー
     document.getElementById('refresh-ai-analysis').addEventListener('click', () => {
         fetchAIAnalysis('1y'); // 固定期間に変更
@@ -58,9 +61,8 @@ async function fetchData(period) {
     try {
         console.log(`${period} のデータを取得中...`);
         
-        // キャッシュを防止するためのタイムスタンプパラメータを追加
-        const timestamp = new Date().getTime();
-        const response = await fetch(`/api/nikkei/analysis?period=${period}&_t=${timestamp}`);
+        // サーバーの ETag によりブラウザのキャッシュが取引日ごとに再検証される
+        const response = await fetch(`/api/nikkei/analysis?period=${period}&format=columnar`);
         
         if (!response.ok) {
             throw new Error('データの取得に失敗しました');
@@ -76,7 +78,7 @@ async function fetchData(period) {
         }
         
         // チャート描画
-        if (data.chart_data && data.chart_data.length > 0) {
+        if (data.chart_data) {
             renderCharts(data.chart_data);
         }
         
@@ -90,6 +92,64 @@ async function fetchData(period) {
     }
 }
 
+// サーバーから配信される最新値（価格・RSI・MACD・シグナル）
+let liveValues = {};
+
+// 最新値の配信を購読する（EventSource は切断時に自動で再接続する）
+function startLiveUpdates() {
+    if (!window.EventSource) {
+        return;
+    }
+    
+    const source = new EventSource('/api/nikkei/stream');
+    const handleEvent = (event) => {
+        // snapshot は全項目、update は変化した項目のみ
+        const values = JSON.parse(event.data);
+        liveValues = event.type === 'snapshot' ? values : { ...liveValues, ...values };
+        applyLiveValues(liveValues);
+    };
+    source.addEventListener('snapshot', handleEvent);
+    source.addEventListener('update', handleEvent);
+    source.onerror = () => console.warn('最新値の配信が切断されました。再接続します...');
+}
+
+// 配信された最新値をチャートの最新の点に反映する
+function applyLiveValues(values) {
+    if (!priceChart || !indicatorChart || !values.date || values.price == null) {
+        return;
+    }
+    
+    const date = values.date.slice(0, 10);
+    const labels = priceChart.data.labels;
+    if (labels.length === 0 || date < labels[labels.length - 1]) {
+        return;
+    }
+    
+    // 同じ日付なら最後の点を更新し、新しい日付なら点を追加する
+    const isNewPoint = date !== labels[labels.length - 1];
+    const setLast = (dataset, value) => {
+        if (isNewPoint) {
+            dataset.data.push(value);
+        } else {
+            dataset.data[dataset.data.length - 1] = value;
+        }
+    };
+    
+    if (isNewPoint) {
+        labels.push(date);
+        if (indicatorChart.data.labels !== labels) {
+            indicatorChart.data.labels.push(date);
+        }
+    }
+    setLast(priceChart.data.datasets[0], values.price);
+    setLast(indicatorChart.data.datasets[0], values.rsi);
+    setLast(indicatorChart.data.datasets[1], values.macd);
+    setLast(indicatorChart.data.datasets[2], values.signal);
+    
+    priceChart.update('none');
+    indicatorChart.update('none');
+}
+
 // データの前処理
 function preprocessChartData(chartData) {
     // 日付を新しい順にソート
@@ -148,22 +208,39 @@ function preprocessChartData(chartData) {
     return sortedData;
 }
 
+// チャートデータを列ごとの配列に揃える（列形式はそのまま、レコード形式は日付順に並べて変換）
+function toChartColumns(chartData) {
+    if (!chartData) {
+        return null;
+    }
+    if (!Array.isArray(chartData)) {
+        return chartData;
+    }
+    
+    const sortedData = [...chartData].sort((a, b) => new Date(a.date) - new Date(b.date));
+    return {
+        date: sortedData.map(d => d.date),
+        Price: sortedData.map(d => d.Price),
+        RSI: sortedData.map(d => d.RSI),
+        MACD: sortedData.map(d => d.MACD),
+        Signal: sortedData.map(d => d.Signal)
+    };
+}
+
 // チャート描画関数
 function renderCharts(chartData) {
-    if (!chartData || chartData.length === 0) {
+    const columns = toChartColumns(chartData);
+    if (!columns || !columns.date || columns.date.length === 0) {
         console.error('チャートデータが空です');
         return;
     }
-
-    // 日付を新しい順にソート
-    const sortedData = [...chartData].sort((a, b) => new Date(a.date) - new Date(b.date));
     
-    // データの準備
-    const dates = sortedData.map(d => d.date);
-    const prices = sortedData.map(d => d.Price);
-    const rsiValues = sortedData.map(d => d.RSI);
-    const macdValues = sortedData.map(d => d.MACD);
-    const signalValues = sortedData.map(d => d.Signal);
+    // データの準備（列形式の配列は日付順に並んでいるのでそのまま Chart.js に渡す）
+    const dates = columns.date;
+    const prices = columns.Price;
+    const rsiValues = columns.RSI;
+    const macdValues = columns.MACD;
+    const signalValues = columns.Signal;
     
     // 既存のチャートを破棄
     if (priceChart) {
@@ -458,8 +535,7 @@ async function fetchAIAnalysis(period, latestData = null) {
             '<div class="text-center my-4"><div class="spinner-border text-success" role="status"></div><p class="mt-2">AIによる高度な分析を実行中...</p></div>';
         
         // リクエストURLをコンソールに出力(デバッグ用)
-        const timestamp = new Date().getTime();
-        const url = `/api/nikkei/ai-analysis?period=${period}&_t=${timestamp}`;
+        const url = `/api/nikkei/ai-analysis?period=${period}`;
         console.log("AI分析リクエストURL:", url);
         
         // APIリクエスト(ハイフン付きパスに戻す)
@@ -829,6 +905,18 @@ function renderAIAnalysis(analysis) {
                                 </div>
                             `).join('') || '主要レベルなし'}
                         </div>
+                        ${Object.entries(analysis.market_condition?.key_levels_by_lookback || {}).slice(1).map(([days, levels]) => `
+                            <div class="mt-3">
+                                <div class="small text-muted mb-1">過去${days}営業日</div>
+                                ${levels.map(level => `
+                                    <div class="mb-1">
+                                        <span class="badge ${level.type === 'サポート' ? 'bg-success' : 'bg-danger'}">${level.type}</span>
+                                        <strong>¥${level.price.toLocaleString()}</strong>
+                                        <small>(強度: ${level.strength})</small>
+                                    </div>
+                                `).join('') || '主要レベルなし'}
+                            </div>
+                        `).join('')}
                     </div>
                 </div>
             </div>
@@ -0,0 +1,274 @@
+"""分析パイプラインのベンチマーク
+
+合成した日足OHLCV（benchmarks/synthetic.py）を使い、ネットワークなしで再現可能に計測する。
+各ステージは毎回データのコピー（特徴量キャッシュが効かない新しいフレーム）と空のモデルレジストリで実行し、
+実行時間（最小・中央値）と、tracemalloc を有効にした別の1回でのピークメモリ・残存メモリを記録する。
+
+使い方（リポジトリのルートで実行）:
+    python benchmarks/run.py                          # 全サイズ・全ステージを計測し、reference との比を表示
+    python benchmarks/run.py --size 1y --size 10y     # サイズを指定
+    python benchmarks/run.py --save-baseline local    # benchmarks/baselines/local.json に保存
+    python benchmarks/run.py --compare reference      # 比較し、悪化があれば終了コード 1
+    python benchmarks/run.py --no-compare             # 比較しない
+
+比較では各ステージの最小時間（中央値より他の処理の影響を受けにくい）とピークメモリを使う。
+既定の reference との比較は参考表示だけで、終了コードは常に 0 にする（同じマシンでも実行ごとの時間の差が大きいため）。
+--compare でベースラインを指定した場合は、threshold を超えて悪化した項目があれば終了コード 1 を返す。
+ただし計測環境（ENVIRONMENT_KEYS）がベースラインと異なる場合は警告を表示するだけで、終了コードは 0 にする。
+benchmarks/baselines/reference.json はリポジトリに含める基準値で、計算方法を変えて速度が変わった場合は
+--save-baseline reference で更新してコミットする（計測環境は結果の environment に記録される）。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCHMARK_DIR.parent / "app"
+BASELINE_DIR = BENCHMARK_DIR / "baselines"
+
+# 既定で比較するベースライン（リポジトリに含める基準値）
+DEFAULT_BASELINE = "reference"
+
+# 悪化を終了コードで知らせるために一致している必要がある計測環境の項目
+ENVIRONMENT_KEYS = ("python", "numpy", "pandas", "sklearn", "platform", "cpu_count")
+
+sys.path.insert(0, str(APP_DIR))
+# 共有メモリに公開済みの特徴量を使うと計算コストを測れないため無効にする
+os.environ["NIKKEI_SHARED_FEATURES"] = "0"
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import sklearn  # noqa: E402
+
+from models.analysis import TechnicalAnalysis, AdvancedAnalysis  # noqa: E402
+from models.registry import model_registry  # noqa: E402
+from models.panel import PanelAnalysis  # noqa: E402
+from services.analysis_service import MarketAnalysisService  # noqa: E402
+
+from synthetic import SIZES, synthetic_ohlcv, synthetic_panel  # noqa: E402
+
+# 複数ティッカーのベンチマーク名（日経225銘柄 × 1年）
+PANEL_SIZE = "225x1y"
+
+
+def _technical(data):
+    analyzer = TechnicalAnalysis()
+    return (
+        analyzer.calculate_rsi(data),
+        analyzer.calculate_macd(data),
+        analyzer.calculate_trend(data),
+        analyzer.analyze_volatility(data),
+    )
+
+
+# ステージ名 → (計測前の準備, 計測する処理)。準備は計測に含めない
+STAGES = {
+    "technical_analysis": (lambda data: (data,), _technical),
+    "calculate_all_indicators": (lambda data: (data,), AdvancedAnalysis.calculate_all_indicators),
+    "predict_trend": (lambda data: (data,), AdvancedAnalysis.predict_trend),
+    "analyze_market_condition": (
+        lambda data: (data, AdvancedAnalysis.calculate_all_indicators(data)),
+        AdvancedAnalysis.analyze_market_condition,
+    ),
+    "comprehensive_analysis": (
+        lambda data: (data,),
+        lambda data: MarketAnalysisService().generate_comprehensive_analysis(data),
+    ),
+}
+
+PANEL_STAGES = {
+    "panel_analysis": (lambda panel: (panel,), lambda panel: PanelAnalysis().analyze(panel)),
+}
+
+
+def _fresh(setup, data):
+    """キャッシュの影響を受けないように、データをコピーしてモデルレジストリを空にしてから準備する"""
+    model_registry.clear()
+    if isinstance(data, dict):
+        data = {column: frame.copy() for column, frame in data.items()}
+    else:
+        data = data.copy()
+    return setup(data)
+
+
+def measure(setup, fn, data, repeat):
+    """1ステージを計測（時間は repeat 回、メモリは tracemalloc を有効にした別の1回）"""
+    fn(*_fresh(setup, data))  # ウォームアップ
+
+    times = []
+    for _ in range(repeat):
+        args = _fresh(setup, data)
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+
+    args = _fresh(setup, data)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    base, _ = tracemalloc.get_traced_memory()
+    result = fn(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    del result
+
+    return {
+        "repeat": repeat,
+        "min_ms": min(times) * 1000,
+        "median_ms": statistics.median(times) * 1000,
+        "peak_kb": (peak - base) / 1024,
+        "retained_kb": (current - base) / 1024,
+        "retained_blocks": retained_blocks,
+    }
+
+
+def run(sizes, repeat, tickers, stages=None):
+    """サイズごと・ステージごとに計測して結果を返す"""
+    results = {}
+    for size in sizes:
+        if size == PANEL_SIZE:
+            data, stage_table = synthetic_panel(tickers, SIZES["1y"]), PANEL_STAGES
+        else:
+            data, stage_table = synthetic_ohlcv(SIZES[size], seed=1), STAGES
+
+        results[size] = {}
+        for name, (setup, fn) in stage_table.items():
+            if stages and name not in stages:
+                continue
+            try:
+                results[size][name] = measure(setup, fn, data, repeat)
+            except Exception as e:
+                results[size][name] = {"error": f"{type(e).__name__}: {e}"}
+            print_row(size, name, results[size][name])
+    return results
+
+
+def environment():
+    """計測環境（ベースラインとの比較時に環境の違いを確認するため）"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def environment_differences(baseline, current):
+    """ENVIRONMENT_KEYS のうちベースラインと異なる項目（{項目: (ベースライン, 今回)}）"""
+    return {
+        key: (baseline.get(key), current.get(key))
+        for key in ENVIRONMENT_KEYS
+        if baseline.get(key) != current.get(key)
+    }
+
+
+def baseline_path(name):
+    path = Path(name)
+    return path if path.suffix == ".json" else BASELINE_DIR / f"{name}.json"
+
+
+def compare(results, baseline, threshold, min_delta_ms=1.0):
+    """ベースラインとの比（今回 / ベースライン）を結果に追加し、threshold を超えて悪化した項目を返す
+
+    1ミリ秒未満のステージは計測のばらつきが大きいため、時間の差が min_delta_ms 以下なら悪化とみなさない。
+    """
+    regressions = []
+    for size, stages in results.items():
+        for name, result in stages.items():
+            base = baseline["results"].get(size, {}).get(name, {})
+            if "min_ms" not in result or "min_ms" not in base:
+                continue
+            for metric in ("min_ms", "peak_kb"):
+                if base[metric] <= 0:
+                    continue
+                ratio = result[metric] / base[metric]
+                result[f"{metric}_ratio"] = ratio
+                if metric == "min_ms" and result[metric] - base[metric] <= min_delta_ms:
+                    continue
+                if ratio > 1 + threshold:
+                    regressions.append((size, name, metric, ratio))
+    return regressions
+
+
+def print_row(size, name, result):
+    if "error" in result:
+        print(f"{size:>8} {name:<26} エラー: {result['error']}")
+        return
+    print(
+        f"{size:>8} {name:<26} {result['median_ms']:>10.2f} {result['min_ms']:>10.2f}"
+        f" {result['peak_kb']:>11.1f} {result['retained_kb']:>11.1f}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析パイプラインのベンチマーク")
+    parser.add_argument("--size", action="append", choices=list(SIZES) + [PANEL_SIZE], help="計測するサイズ（既定は全サイズ）")
+    parser.add_argument("--stage", action="append", choices=list(STAGES) + list(PANEL_STAGES), help="計測するステージ（既定は全ステージ）")
+    parser.add_argument("--repeat", type=int, default=5, help="時間を計測する回数")
+    parser.add_argument("--tickers", type=int, default=225, help=f"{PANEL_SIZE} のティッカー数")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--save-baseline", metavar="NAME", help="結果をベースライン（benchmarks/baselines/NAME.json）として保存")
+    parser.add_argument("--compare", metavar="NAME", help="比較するベースライン（名前またはJSONファイル）。悪化があれば終了コード 1 を返す")
+    parser.add_argument("--no-compare", action="store_true", help=f"既定の {DEFAULT_BASELINE} とも比較しない")
+    parser.add_argument("--threshold", type=float, default=0.2, help="悪化とみなす比率（0.2 = 20%%増）")
+    args = parser.parse_args(argv)
+
+    print(f"{'size':>8} {'stage':<26} {'median_ms':>10} {'min_ms':>10} {'peak_kb':>11} {'retained_kb':>11}")
+    results = run(args.size or list(SIZES) + [PANEL_SIZE], max(1, args.repeat), args.tickers, args.stage)
+    report = {"environment": environment(), "results": results}
+
+    regressions = []
+    compare_with = args.compare or (None if args.no_compare else DEFAULT_BASELINE)
+    # ベースラインとして保存する場合は自身との比較になるため比較しない
+    if compare_with and args.save_baseline != compare_with:
+        with open(baseline_path(compare_with), encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(f"\nベースライン: {baseline_path(compare_with)} ({baseline['environment'].get('commit')}, {baseline['environment'].get('date')})")
+        for size, stages in results.items():
+            for name, result in stages.items():
+                if "min_ms_ratio" in result:
+                    print(f"{size:>8} {name:<26} 時間 x{result['min_ms_ratio']:.2f}  ピークメモリ x{result.get('peak_kb_ratio', float('nan')):.2f}")
+        for size, name, metric, ratio in regressions:
+            print(f"悪化: {size} {name} {metric} x{ratio:.2f}")
+        differences = environment_differences(baseline["environment"], report["environment"])
+        if differences:
+            print("警告: 計測環境がベースラインと異なるため、悪化は終了コードに反映しません")
+            for key, (base, current) in differences.items():
+                print(f"  {key}: {base} -> {current}")
+            regressions = []
+        elif regressions and not args.compare:
+            print(f"参考表示のため終了コードには反映しません（判定する場合は --compare {DEFAULT_BASELINE}）")
+            regressions = []
+
+    for path in filter(None, [args.output, args.save_baseline and baseline_path(args.save_baseline)]):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {path}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+# ベンチマークの期間（営業日数）
+SIZES = {
+    "1mo": 21,
+    "1y": 252,
+    "10y": 2520,
+    "35y": 8820,
+}
+
+# 生成する日付の最終日（再現性のため固定）
+END_DATE = "2024-12-30"
+
+
+def synthetic_ohlcv(rows, seed=0, base=30000.0, ticker="SYN"):
+    """再現可能な日足OHLCVを生成
+
+    StockDataService._get_sample_data と同じく営業日の日付で、終値は対数正規のランダムウォーク、
+    始値・高値・安値は streamlit 版の生成器と同じく終値のまわりにばらつかせる。
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=END_DATE, periods=rows, name="Date")
+
+    closes = base * np.exp(np.cumsum(rng.normal(0.0002, 0.012, rows)))
+    opens = closes * (1 + rng.normal(0, 0.004, rows))
+    highs = np.maximum(opens, closes) * (1 + np.abs(rng.normal(0, 0.004, rows)))
+    lows = np.minimum(opens, closes) * (1 - np.abs(rng.normal(0, 0.004, rows)))
+    volumes = rng.integers(1_000_000, 5_000_000, rows).astype("float64")
+
+    df = pd.DataFrame({
+        "Open": opens,
+        "High": highs,
+        "Low": lows,
+        "Close": closes,
+        "Adj Close": closes,
+        "Volume": volumes,
+    }, index=dates)
+    df.attrs["ticker"] = ticker
+    return df
+
+
+def synthetic_panel(tickers, rows, seed=0):
+    """複数ティッカーの「日付×ティッカー」の列ごとの行列（get_panel_data と同じ形）を生成"""
+    frames = {
+        f"SYN{i:03d}": synthetic_ohlcv(rows, seed=seed + i, base=1000.0 * (1 + i % 50), ticker=f"SYN{i:03d}")
+        for i in range(tickers)
+    }
+    return {
+        column: pd.DataFrame({ticker: frame[column] for ticker, frame in frames.items()})
+        for column in ("Open", "High", "Low", "Close", "Volume")
+    }
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# アプリは app/ をカレントディレクトリとして起動するため、同じ形で import できるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+
+def make_prices(end, periods=300, seed=0):
+    """end を最終日とする日経平均らしい日足（end 以外は営業日のみ）"""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end)
+    index = pd.bdate_range(end=end - pd.Timedelta(days=1), periods=periods - 1).append(pd.DatetimeIndex([end]))
+    index.name = "Date"
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.012, periods)))
+    open_ = close * (1 + rng.normal(0, 0.003, periods))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.004, periods)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.004, periods)))
+    volume = rng.integers(1_000_000, 5_000_000, periods).astype(float)
+    return pd.DataFrame(
+        {"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume}, index=index
+    )
+
+
+@pytest.fixture
+def prices():
+    return make_prices
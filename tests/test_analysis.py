@@ -0,0 +1,24 @@
+from models.analysis import AdvancedAnalysis, KEY_LEVEL_LOOKBACKS
+
+INDICATORS = {"adx": 25.0, "volatility": 1.5, "rsi": 50.0}
+
+
+def test_market_condition_includes_long_lookback_levels(prices):
+    data = prices("2026-10-16", periods=1500)
+
+    condition = AdvancedAnalysis.analyze_market_condition(data, INDICATORS)
+
+    levels = condition["key_levels_by_lookback"]
+    assert list(levels) == [60, *KEY_LEVEL_LOOKBACKS]
+    assert condition["key_levels"] == levels[60]
+    current_price = data["Close"].iloc[-1]
+    for lookback in KEY_LEVEL_LOOKBACKS:
+        assert levels[lookback] == AdvancedAnalysis.find_key_levels(data["Close"].tail(lookback), current_price)
+
+
+def test_market_condition_skips_lookbacks_longer_than_data(prices):
+    data = prices("2026-10-16", periods=300)
+
+    condition = AdvancedAnalysis.analyze_market_condition(data, INDICATORS)
+
+    assert list(condition["key_levels_by_lookback"]) == [60, 250]
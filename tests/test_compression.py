@@ -0,0 +1,44 @@
+import asyncio
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+
+from services.compression import CompressionMiddleware
+
+
+def _request(app, accept_encoding=None):
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding is not None else []
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, minimum_size=1024)(scope, receive, send))
+    return Headers(raw=messages[0]["headers"])
+
+
+def test_vary_on_compressed_response():
+    headers = _request(JSONResponse({"values": list(range(1000))}), "gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+
+
+def test_vary_on_small_uncompressed_response():
+    headers = _request(JSONResponse({"value": 1}), "gzip")
+    assert "content-encoding" not in headers
+    assert headers["vary"] == "Accept-Encoding"
+
+
+def test_vary_when_client_does_not_accept_compression():
+    headers = _request(JSONResponse({"values": list(range(1000))}), None)
+    assert "content-encoding" not in headers
+    assert headers["vary"] == "Accept-Encoding"
+
+
+def test_no_vary_on_non_compressible_type():
+    headers = _request(Response(b"\x00" * 2048, media_type="image/png"), "gzip")
+    assert "vary" not in headers
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from services.data import StockDataService
+from services.live import LiveBroadcaster
+from services.snapshots import JST
+
+
+def _broadcaster(monkeypatch, data, market_open, quote=None):
+    store = {"data": data}
+    monkeypatch.setattr(StockDataService, "get_nikkei_data", lambda self, period="1y": store["data"])
+    monkeypatch.setattr(StockDataService, "last_date", lambda self, ticker=None: store["data"].index[-1].strftime("%Y-%m-%d"))
+    monkeypatch.setattr(StockDataService, "get_intraday_quote", lambda self: quote)
+    monkeypatch.setattr(LiveBroadcaster, "is_market_open", lambda self, now=None: market_open)
+    return LiveBroadcaster(executor=None), store
+
+
+def test_after_close_streams_the_chart_last_date(monkeypatch, prices):
+    today = datetime.now(JST).date()
+    data = prices(today)
+    broadcaster, _ = _broadcaster(monkeypatch, data, market_open=False)
+
+    values = broadcaster.compute()
+
+    # チャート（/api/nikkei/analysis）は同じ日足の最終日までを表示する
+    assert values["date"] == data.index[-1].strftime("%Y-%m-%d")
+    assert values["price"] == data["Close"].iloc[-1]
+    assert values["live"] is False
+
+
+def test_during_session_replaces_today_bar_with_quote(monkeypatch, prices):
+    today = datetime.now(JST).date()
+    data = prices(today)
+    quote = {"price": 31000.0, "high": 31100.0, "low": 30900.0, "time": f"{today}T10:00:00+09:00"}
+    broadcaster, _ = _broadcaster(monkeypatch, data, market_open=True, quote=quote)
+
+    values = broadcaster.compute()
+
+    assert values["live"] is True
+    assert values["price"] == 31000.0
+    assert broadcaster._history_date == data.index[-2].strftime("%Y-%m-%d")
+
+
+def test_rebuilds_when_store_last_date_changes(monkeypatch, prices):
+    today = datetime.now(JST).date()
+    data = prices(today)
+    broadcaster, store = _broadcaster(monkeypatch, data.iloc[:-1], market_open=False)
+    assert broadcaster.compute()["date"] == data.index[-2].strftime("%Y-%m-%d")
+
+    # 大引け後に当日の日足がストアに追加された
+    store["data"] = data
+    assert broadcaster.compute()["date"] == data.index[-1].strftime("%Y-%m-%d")
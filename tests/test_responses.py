@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from starlette.requests import Request
+
+from services.data import StockDataService
+from services.responses import CacheValidator
+from services.snapshots import JST, SnapshotService
+
+
+def _request(**headers):
+    raw = [(key.replace("_", "-").encode(), value.encode()) for key, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw, "query_string": b""})
+
+
+def test_same_day_rebuild_is_not_served_as_not_modified(monkeypatch, tmp_path):
+    snapshots = SnapshotService(root=tmp_path)
+    now = datetime(2026, 10, 16, 16, 0, tzinfo=JST)
+
+    # 大引け後の1回目は当日の日足が未配信で、再試行で当日分が追加された
+    monkeypatch.setattr(StockDataService, "last_date", lambda self, ticker=None: "2026-10-15")
+    before = CacheValidator(*snapshots.validator("analysis", "1y", now)[:2])
+    monkeypatch.setattr(StockDataService, "last_date", lambda self, ticker=None: "2026-10-16")
+    after = CacheValidator(*snapshots.validator("analysis", "1y", now)[:2])
+
+    cached = before.headers()
+    assert cached["Last-Modified"] == after.headers()["Last-Modified"]
+    assert not after.is_fresh(_request(if_modified_since=cached["Last-Modified"]))
+    assert not after.is_fresh(_request(if_none_match=cached["ETag"], if_modified_since=cached["Last-Modified"]))
+    assert after.is_fresh(_request(if_none_match=after.headers()["ETag"]))